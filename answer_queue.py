@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+
+import database as db
+
+logger = logging.getLogger(__name__)
+
+# Flush when this many answers are buffered or this many seconds have passed
+ANSWER_BATCH_SIZE = int(os.getenv("ANSWER_BATCH_SIZE", "500"))
+ANSWER_FLUSH_INTERVAL = float(os.getenv("ANSWER_FLUSH_INTERVAL", "1.0"))
+ANSWER_FLUSH_RETRIES = 3
+
+_STOP = object()
+
+
+class AnswerWriter:
+    """Buffers poll answers in memory and writes them to answer_log in batches."""
+
+    def __init__(self, batch_size=ANSWER_BATCH_SIZE, flush_interval=ANSWER_FLUSH_INTERVAL, on_flush=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Called with each batch once it is committed
+        self.on_flush = on_flush
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._stopping = False
+        self.flushed = 0
+        self.dropped = 0
+
+    def start(self):
+        """Starts the background flush task on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops accepting answers and waits until everything buffered is written."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._queue.put_nowait(_STOP)
+        await self._task
+        self._task = None
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def submit(self, user_id, username, is_correct, session_id):
+        """Queues an answer; the timestamp is taken now so batching does not skew it."""
+        self._queue.put_nowait((user_id, username, is_correct, session_id, datetime.now(timezone.utc)))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    done = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+        # Anything submitted after the stop marker still gets written
+        leftover = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                leftover.append(item)
+        for i in range(0, len(leftover), self.batch_size):
+            await self._flush(leftover[i:i + self.batch_size])
+
+    async def _flush(self, batch):
+        for attempt in range(1, ANSWER_FLUSH_RETRIES + 1):
+            try:
+                await db.run(db.log_answers, batch)
+                break
+            except Exception as e:
+                logger.error(f"❌ Failed to flush {len(batch)} answers (attempt {attempt}): {e}")
+                if attempt < ANSWER_FLUSH_RETRIES:
+                    await asyncio.sleep(self.flush_interval * attempt)
+        else:
+            self.dropped += len(batch)
+            logger.error(f"❌ Dropped {len(batch)} answers after {ANSWER_FLUSH_RETRIES} attempts")
+            return
+        self.flushed += len(batch)
+        # Outside the retries: the batch is committed, so a failing callback must not write it again
+        if self.on_flush:
+            try:
+                self.on_flush(batch)
+            except Exception as e:
+                logger.error(f"❌ on_flush failed for {len(batch)} written answers: {e}")
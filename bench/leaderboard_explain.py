@@ -0,0 +1,103 @@
+"""
+Seeds a scratch Postgres with a large answer_log and checks the leaderboard query plans.
+
+    BENCH_DATABASE_URL=postgresql://localhost/quiz_bench python bench/leaderboard_explain.py --rows 10000000
+
+Every leaderboard variant is run under EXPLAIN (ANALYZE, BUFFERS). The script exits non-zero if
+a plan falls back to a sequential scan of answer_log or one of its partitions, or if a query takes
+longer than --budget-ms. Never point it at the production database: it truncates answer_log and
+its rollups.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import database as db
+
+# A sequential scan of answer_log or of any of its monthly partitions
+SEQ_SCAN = re.compile(r"Seq Scan on answer_log(_p\d{4}_\d{2})?\b")
+
+
+def seed(cursor, rows, users, sessions, days):
+    print(f"Seeding {rows:,} answers ({users:,} users, {sessions:,} sessions, {days} days)...")
+    cursor.execute("TRUNCATE answer_log, answer_daily_totals, answer_session_totals")
+    today = datetime.now(timezone.utc).date()
+    db.create_answer_log_partitions(cursor, today - timedelta(days=days), today)
+    cursor.execute(
+        """
+        INSERT INTO answer_log (user_id, username, is_correct, session_id, timestamp)
+        SELECT u,
+               'user_' || u || CASE WHEN g %% 7 = 0 THEN '_renamed' ELSE '' END,
+               random() < 0.6,
+               'session-' || (g %% %s),
+               NOW() - random() * %s * INTERVAL '1 day'
+        FROM (SELECT g, 1 + (g * 7919) %% %s AS u FROM generate_series(1, %s) AS g) s
+        """,
+        (sessions, days, users, rows)
+    )
+    db._rebuild_daily_totals(cursor)
+    cursor.execute("ANALYZE answer_log")
+    cursor.execute("ANALYZE answer_daily_totals")
+
+
+def explain(cursor, label, query, params):
+    cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT TEXT) " + query, params)
+    plan = "\n".join(row[0] for row in cursor.fetchall())
+    started = time.perf_counter()
+    cursor.execute(query, params)
+    cursor.fetchall()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"\n=== {label}: {elapsed_ms:.1f} ms ===\n{plan}")
+    return plan, elapsed_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--budget-ms", type=float, default=250.0)
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the rows already in the database")
+    args = parser.parse_args()
+
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        sys.exit("BENCH_DATABASE_URL is not set")
+    os.environ["DATABASE_URL"] = url
+
+    db.initialize_database()
+    conn = db.get_db_connection()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    if not args.skip_seed:
+        seed(cursor, args.rows, args.users, args.sessions, args.days)
+
+    cases = [
+        ("session", db.leaderboard_query(session_id="session-42")),
+        ("session page 3", db.leaderboard_query(session_id="session-42", offset=2 * db.LEADERBOARD_PAGE_SIZE)),
+    ] + [(frame, db.leaderboard_query(time_frame=frame)) for frame in ("daily", "weekly", "monthly", "all")]
+
+    failures = []
+    for label, (query, params) in cases:
+        plan, elapsed_ms = explain(cursor, label, query, params)
+        if SEQ_SCAN.search(plan):
+            failures.append(f"{label}: sequential scan on answer_log")
+        if elapsed_ms > args.budget_ms:
+            failures.append(f"{label}: {elapsed_ms:.1f} ms exceeds {args.budget_ms} ms budget")
+
+    cursor.close()
+    conn.close()
+    if failures:
+        print("\nFAILED:\n" + "\n".join(failures))
+        sys.exit(1)
+    print("\nAll leaderboard plans use indexes and are within budget.")
+
+
+if __name__ == "__main__":
+    main()
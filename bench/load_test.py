@@ -0,0 +1,488 @@
+"""
+Offline load test: drives the bot's real handlers through a python-telegram-bot Application whose
+Bot API calls are answered in-process, so no Telegram group is needed.
+
+    python bench/load_test.py --questions 1000 --answers 50000 --polls 500
+    BENCH_DATABASE_URL=postgresql://localhost/quiz_bench python bench/load_test.py --leaderboard-sizes 100000,1000000,10000000
+
+Reports:
+  * upload-to-last-poll: an admin uploads a synthetic .xlsx with --questions rows; timed from the
+    update entering the Application until the fake API has received the last sendPoll;
+  * answers/sec and p50/p99 handle_poll_answer latency for a storm of --answers PollAnswer
+    updates spread over --polls of the polls just sent, plus how long the writer takes to drain;
+  * leaderboard query times at each of --leaderboard-sizes answer_log rows (needs BENCH_DATABASE_URL).
+
+Without BENCH_DATABASE_URL, database calls go to an in-memory stand-in that sleeps --db-latency-ms
+per call. Telegram's send rate limits are lifted unless --real-limits is given, so the numbers
+measure the bot rather than the API quotas. Never point BENCH_DATABASE_URL at the production
+database: the leaderboard step truncates answer_log.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+BENCH_TOKEN = "123456:bench"
+BENCH_GROUP_ID = -100123
+BENCH_ADMIN_ID = 42
+
+
+class FakeBotApi:
+    """
+    Stands in for the Bot API behind the bot's request object: answers every method locally,
+    records sent polls and serves uploaded files. `latency` seconds are added to each call.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.files = {}
+        self.polls = []
+        self.calls = {}
+        self.last_poll_at = None
+        self._message_ids = itertools.count(1)
+        self._poll_ids = itertools.count(1)
+        self._waiters = []
+
+    def add_file(self, file_id, content):
+        self.files[file_id] = content
+
+    async def wait_for_polls(self, count):
+        """Waits until at least `count` polls have been sent."""
+        if len(self.polls) >= count:
+            return
+        waiter = (count, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        await waiter[1]
+
+    def _message(self, chat_id, **fields):
+        if str(chat_id).startswith('@'):
+            chat = {'id': -1001000000000, 'type': 'channel', 'username': chat_id[1:]}
+        else:
+            chat_id = int(chat_id)
+            chat = {'id': chat_id, 'type': 'supergroup' if chat_id < 0 else 'private'}
+        return dict(message_id=next(self._message_ids), date=int(time.time()), chat=chat, **fields)
+
+    def _send_poll(self, params):
+        poll_id = str(next(self._poll_ids))
+        poll = {
+            'id': poll_id,
+            'question': params['question'],
+            'options': [{'text': text, 'voter_count': 0} for text in params['options']],
+            'total_voter_count': 0,
+            'is_closed': False,
+            'is_anonymous': False,
+            'type': 'quiz',
+            'allows_multiple_answers': False,
+            'correct_option_id': params.get('correct_option_id'),
+        }
+        self.polls.append((poll_id, len(params['options'])))
+        self.last_poll_at = time.perf_counter()
+        for waiter in [w for w in self._waiters if len(self.polls) >= w[0]]:
+            self._waiters.remove(waiter)
+            waiter[1].set_result(None)
+        return self._message(params['chat_id'], poll=poll)
+
+    def call(self, method, params):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': "Bench", 'username': "bench_bot"}
+        if method == 'sendPoll':
+            return self._send_poll(params)
+        if method in ('sendMessage', 'editMessageText'):
+            return self._message(params['chat_id'], text=params.get('text', ""))
+        if method == 'getFile':
+            file_id = params['file_id']
+            return {'file_id': file_id, 'file_unique_id': file_id,
+                    'file_size': len(self.files[file_id]), 'file_path': f"documents/{file_id}"}
+        return True
+
+    def request(self):
+        """Returns a telegram BaseRequest that routes every call to this fake API."""
+        from telegram.request import BaseRequest
+
+        api = self
+
+        class FakeRequest(BaseRequest):
+            async def initialize(self):
+                pass
+
+            async def shutdown(self):
+                pass
+
+            async def do_request(self, url, method, request_data=None, read_timeout=None,
+                                 write_timeout=None, connect_timeout=None, pool_timeout=None):
+                if api.latency:
+                    await asyncio.sleep(api.latency)
+                if "/file/bot" in url:
+                    return 200, api.files[url.rsplit('/', 1)[1]]
+                params = request_data.parameters if request_data else {}
+                result = api.call(url.rsplit('/', 1)[1], params)
+                return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+        return FakeRequest()
+
+
+class MemoryDatabase:
+    """
+    In-memory stand-in for the database functions the bot calls through db.run.
+    Each call sleeps `latency` seconds on the executor thread to model a Postgres round trip.
+    """
+
+    FUNCTIONS = (
+        'log_answers', 'save_poll', 'get_poll', 'expire_polls', 'known_questions', 'save_questions',
+        'get_questions', 'save_quiz_session', 'get_quiz_session', 'get_quiz_session_questions',
+        'get_unfinished_quiz_sessions', 'set_quiz_session_status', 'get_user_stats', 'get_leaderboard',
+        'maintain_answer_log', 'save_poll_stats', 'get_session_poll_stats',
+    )
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.answers = []
+        self.poll_stats = {}
+        self.polls = {}
+        self.questions = {}
+        self.sessions = {}
+        self._lock = threading.Lock()
+
+    def install(self, module):
+        for name in self.FUNCTIONS:
+            setattr(module, name, getattr(self, name))
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def log_answers(self, rows):
+        self._wait()
+        with self._lock:
+            self.answers.extend(rows)
+
+    def save_poll(self, poll_id, correct_option_id, session_id, position=None):
+        self._wait()
+        with self._lock:
+            self.polls[poll_id] = {
+                'correct_option_id': correct_option_id, 'session_id': session_id, 'position': position,
+                'created_at': datetime.now(timezone.utc),
+            }
+            session = self.sessions.get(session_id)
+            if session is not None and position is not None:
+                session['next_index'] = max(session['next_index'], position + 1)
+
+    def get_poll(self, poll_id):
+        self._wait()
+        return self.polls.get(poll_id)
+
+    def expire_polls(self, retention_days):
+        return 0
+
+    def known_questions(self, hashes):
+        self._wait()
+        return {h for h in hashes if h in self.questions}
+
+    def save_questions(self, polls):
+        self._wait()
+        with self._lock:
+            new = sum(1 for poll in polls if poll['hash'] not in self.questions)
+            self.questions.update((poll['hash'], dict(poll)) for poll in polls)
+        return new
+
+    def get_questions(self, hashes):
+        self._wait()
+        return [self.questions.get(h) for h in hashes]
+
+    def save_quiz_session(self, session_id, chat_id, hashes, status='running', scheduled_at=None,
+                          status_chat_id=None, status_message_id=None):
+        self._wait()
+        with self._lock:
+            self.sessions[session_id] = {
+                'session_id': session_id, 'chat_id': str(chat_id), 'question_hashes': list(hashes),
+                'status': status, 'next_index': 0, 'scheduled_at': scheduled_at,
+                'status_chat_id': None if status_chat_id is None else str(status_chat_id),
+                'status_message_id': status_message_id,
+            }
+
+    def get_quiz_session(self, session_id):
+        self._wait()
+        session = self.sessions.get(session_id)
+        return dict(session) if session else None
+
+    def get_quiz_session_questions(self, session_id):
+        session = self.get_quiz_session(session_id)
+        return session['question_hashes'] if session else None
+
+    def get_unfinished_quiz_sessions(self):
+        return [dict(s) for s in self.sessions.values() if s['status'] != 'finished']
+
+    def set_quiz_session_status(self, session_id, status):
+        self._wait()
+        with self._lock:
+            self.sessions[session_id]['status'] = status
+
+    def get_user_stats(self):
+        return []
+
+    def get_leaderboard(self, time_frame='all', session_id=None, offset=0, limit=50):
+        self._wait()
+        return []
+
+    def maintain_answer_log(self):
+        return []
+
+    def save_poll_stats(self, rows):
+        self._wait()
+        with self._lock:
+            for poll_id, session_id, correct_option_id, option_counts, answer_seconds, answers, correct in rows:
+                stats = self.poll_stats.setdefault(poll_id, {
+                    'poll_id': poll_id, 'session_id': session_id, 'correct_option_id': correct_option_id,
+                    'option_counts': [], 'answer_seconds': [0] * len(answer_seconds), 'answers': 0, 'correct': 0,
+                })
+                counts = stats['option_counts']
+                counts.extend([0] * (len(option_counts) - len(counts)))
+                for i, count in enumerate(option_counts):
+                    counts[i] += count
+                for i, count in enumerate(answer_seconds):
+                    stats['answer_seconds'][i] += count
+                stats['answers'] += answers
+                stats['correct'] += correct
+
+    def get_session_poll_stats(self, session_id):
+        self._wait()
+        with self._lock:
+            return [
+                dict(stats, position=self.polls.get(poll_id, {}).get('position'), label=None, question=None)
+                for poll_id, stats in self.poll_stats.items() if stats['session_id'] == session_id
+            ]
+
+
+def write_sheet(questions):
+    """Returns the bytes of a quiz .xlsx with `questions` valid bilingual rows."""
+    from openpyxl import Workbook
+    from quiz_sheet import COLUMNS, OPTION_LABELS
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(COLUMNS.values()))
+    for n in range(1, questions + 1):
+        row = {
+            'question_no': n,
+            'question_english': f"Benchmark question {n}: which option is correct?",
+            'question_hindi': f"प्रश्न {n}: कौन सा विकल्प सही है?",
+            'explanation_english': f"Option {OPTION_LABELS[n % 4]} is correct.",
+            'explanation_hindi': "",
+            'exam_name_year': "Bench 2026\n",
+            'answer_english': OPTION_LABELS[n % 4],
+            'answer_hindi': "",
+        }
+        for label in OPTION_LABELS:
+            row[f'option_{label.lower()}_english'] = f"Answer {label}{n}"
+            row[f'option_{label.lower()}_hindi'] = f"उत्तर {label}{n}"
+        sheet.append([row[field] for field in COLUMNS])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def timed(callback, samples):
+    """Wraps a handler callback so each call's duration is appended to `samples`."""
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            samples.append(time.perf_counter() - started)
+    return wrapper
+
+
+async def bench_upload(app, api, questions, update_ids):
+    from telegram import Update
+
+    content = write_sheet(questions)
+    api.add_file("bench-sheet", content)
+    admin = {'id': BENCH_ADMIN_ID, 'is_bot': False, 'first_name': "Admin", 'username': "admin"}
+    update = Update.de_json({
+        'update_id': next(update_ids),
+        'message': {
+            'message_id': 1, 'date': int(time.time()), 'from': admin,
+            'chat': {'id': BENCH_ADMIN_ID, 'type': 'private'},
+            'document': {'file_id': "bench-sheet", 'file_unique_id': "bench-sheet",
+                         'file_name': "bench.xlsx", 'file_size': len(content)},
+            'caption': str(BENCH_GROUP_ID),
+        },
+    }, app.bot)
+
+    print(f"Upload: {questions:,} questions ({len(content) / 1024:.0f} KiB .xlsx)")
+    started = time.perf_counter()
+    await app.update_queue.put(update)
+    await api.wait_for_polls(questions)
+    elapsed = api.last_poll_at - started
+    print(f"  upload-to-last-poll: {elapsed:.2f} s ({questions / elapsed:,.0f} polls/s)")
+
+
+async def bench_answers(app, api, answers, polls, update_ids, samples):
+    import random
+
+    import bot
+    import database as db
+    from telegram import Update
+
+    polls = api.polls[:polls]
+    users = max(1, answers // 20)
+    updates = []
+    for _ in range(answers):
+        poll_id, option_count = random.choice(polls)
+        user_id = 1000 + random.randrange(users)
+        updates.append(Update.de_json({
+            'update_id': next(update_ids),
+            'poll_answer': {
+                'poll_id': poll_id,
+                'user': {'id': user_id, 'is_bot': False, 'first_name': "User", 'username': f"user_{user_id}"},
+                'option_ids': [random.randrange(option_count)],
+            },
+        }, app.bot))
+
+    print(f"Answers: {answers:,} across {len(polls):,} polls from {users:,} users")
+    samples.clear()
+    flushed_before = bot.answer_writer.flushed
+    started = time.perf_counter()
+    for update in updates:
+        app.update_queue.put_nowait(update)
+    while len(samples) < answers:
+        await asyncio.sleep(0.01)
+    handled = time.perf_counter() - started
+    while bot.answer_writer.flushed - flushed_before < answers and bot.answer_writer.dropped == 0:
+        await asyncio.sleep(0.01)
+    drained = time.perf_counter() - started
+
+    print(f"  handled: {answers / handled:,.0f} answers/s ({handled:.2f} s)")
+    print(f"  handler latency: p50 {percentile(samples, 50) * 1e6:,.0f} µs, "
+          f"p99 {percentile(samples, 99) * 1e6:,.0f} µs, max {max(samples) * 1e6:,.0f} µs")
+    print(f"  written to answer_log after {drained:.2f} s ({bot.answer_writer.dropped} dropped)")
+
+    # The end-of-quiz summary reads the flushed per-poll aggregates, not answer_log
+    started = time.perf_counter()
+    await bot.poll_aggregator.flush()
+    session_id = (await db.run(db.get_poll, polls[0][0]))['session_id']
+    summary = bot.format_summary(
+        session_id, await db.run(db.get_session_poll_stats, session_id),
+        bot.rank_scores(bot.poll_aggregator.scores(session_id) or {}, bot.SUMMARY_LEADERBOARD),
+    )
+    print(f"  session summary built from poll_stats in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+def bench_leaderboards(sizes, repeat):
+    import database as db
+    from leaderboard_explain import seed
+
+    # post_shutdown closed the pool used by the bot
+    db.init_pool()
+    conn = db.get_db_connection()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cases = [("session", {'session_id': "session-42"})] + [
+        (frame, {'time_frame': frame}) for frame in ("daily", "weekly", "monthly", "all")
+    ]
+    print("Leaderboard (median of %d runs, ms):" % repeat)
+    print("  " + f"{'rows':>12}" + "".join(f"{label:>10}" for label, _ in cases))
+    for size in sizes:
+        seed(cursor, size, users=max(1, size // 200), sessions=max(1, size // 500), days=365)
+        timings = []
+        for _label, kwargs in cases:
+            runs = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                db.get_leaderboard(**kwargs)
+                runs.append((time.perf_counter() - started) * 1000)
+            timings.append(statistics.median(runs))
+        print("  " + f"{size:>12,}" + "".join(f"{t:>10.1f}" for t in timings))
+    cursor.close()
+    conn.close()
+    db.close_pool()
+
+
+async def run(args):
+    import bot
+    import database as db
+    from telegram.ext import PollAnswerHandler
+
+    api = FakeBotApi(latency=args.api_latency_ms / 1000)
+    if args.database_url:
+        db.initialize_database()
+        db.init_pool()
+    else:
+        MemoryDatabase(latency=args.db_latency_ms / 1000).install(db)
+
+    app = bot.build_application(request=api.request())
+    samples = []
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, PollAnswerHandler):
+                handler.callback = timed(handler.callback, samples)
+
+    await app.initialize()
+    await bot.post_init(app)
+    await app.start()
+    await bot.warm_up_task
+    update_ids = itertools.count(1)
+    try:
+        await bench_upload(app, api, args.questions, update_ids)
+        await bench_answers(app, api, args.answers, min(args.polls, args.questions), update_ids, samples)
+    finally:
+        await app.stop()
+        await bot.post_shutdown(app)
+        await app.shutdown()
+    print(f"Bot API calls: {api.calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=1000, help="rows in the uploaded sheet")
+    parser.add_argument("--answers", type=int, default=50_000)
+    parser.add_argument("--polls", type=int, default=500, help="polls the answers are spread over")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="added to every Bot API call")
+    parser.add_argument("--db-latency-ms", type=float, default=1.0, help="per call, in-memory database only")
+    parser.add_argument("--real-limits", action="store_true", help="keep Telegram's send rate limits")
+    parser.add_argument("--leaderboard-sizes", default="100000,1000000",
+                        help="comma-separated answer_log sizes (needs BENCH_DATABASE_URL)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own logging")
+    args = parser.parse_args()
+    args.database_url = os.getenv("BENCH_DATABASE_URL")
+
+    # Read by bot.py and dispatcher.py at import time
+    os.environ.update(BOT_TOKEN=BENCH_TOKEN, GROUP_CHAT_ID=str(BENCH_GROUP_ID), ADMIN_USER_IDS=str(BENCH_ADMIN_ID))
+    if not args.real_limits:
+        for name in ("GROUP_MESSAGES_PER_MINUTE", "PRIVATE_MESSAGES_PER_SECOND", "GLOBAL_MESSAGES_PER_SECOND"):
+            os.environ[name] = "1000000"
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+
+    import bot  # noqa: F401  (configures logging)
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    asyncio.run(run(args))
+
+    if args.database_url:
+        sizes = [int(size) for size in args.leaderboard_sizes.split(",") if size]
+        bench_leaderboards(sizes, args.repeat)
+    else:
+        print("Leaderboard: skipped, set BENCH_DATABASE_URL to time queries against Postgres")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Checks the bot's cold-start budget without Telegram or Postgres.
+
+    python bench/startup_budget.py --import-budget-ms 1000 --startup-budget-ms 2500
+
+Two measurements, each in fresh interpreters:
+  * import: time to `import bot` (median of --runs). Modules that must stay lazy, such as openpyxl,
+    fail the check if they are imported at boot;
+  * startup: time from spawning `python` until the webhook port answers, with the Bot API faked and
+    the database replaced by the load test's in-memory stand-in. Loading user stats is made to take
+    --warm-up-delay seconds, and the port must answer before that, i.e. serving must not wait for warm-up.
+
+Exits non-zero if either budget is exceeded. The budgets are wall-clock checks meant for a quiet
+machine; --no-timing keeps only the checks that don't depend on the machine's speed (no eager
+imports, serving before warm-up finishes), and is what the deploy build runs. Schema migrations are not part of the measurement: with
+an up-to-date schema initialize_database is a single query.
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Ingestion dependencies that only an upload should import
+LAZY_MODULES = ("openpyxl",)
+
+BENCH_ENV = {"BOT_TOKEN": "123456:bench", "GROUP_CHAT_ID": "-100123", "ADMIN_USER_IDS": "42"}
+
+IMPORT_PROBE = f"""
+import sys, time
+sys.path.insert(0, {ROOT!r})
+started = time.perf_counter()
+import bot
+print(time.perf_counter() - started)
+print(",".join(name for name in {LAZY_MODULES!r} if name in sys.modules))
+"""
+
+
+def measure_import(runs):
+    timings = []
+    eager = set()
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE], env=dict(os.environ, **BENCH_ENV),
+            capture_output=True, text=True, check=True,
+        ).stdout.splitlines()
+        timings.append(float(output[0]) * 1000)
+        eager.update(name for name in output[1].split(",") if name)
+    return statistics.median(timings), sorted(eager)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_startup(warm_up_delay, timeout=30):
+    """Returns milliseconds from spawning the bot until /metrics answers."""
+    port = free_port()
+    started = time.perf_counter()
+    child = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", str(port), "--warm-up-delay", str(warm_up_delay)],
+        env=dict(os.environ, **BENCH_ENV), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if child.poll() is not None:
+                raise RuntimeError(f"bot exited with status {child.returncode} before serving")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"bot did not serve within {timeout}s")
+    finally:
+        child.send_signal(signal.SIGTERM)
+        try:
+            child.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            child.kill()
+
+
+def serve(port, warm_up_delay):
+    """Child process: boots the real webhook server against the fake Bot API and database."""
+    import asyncio
+
+    sys.path.insert(0, ROOT)
+    import bot
+    import database as db
+    import webhook_server
+    from load_test import FakeBotApi, MemoryDatabase
+
+    class SlowStatsDatabase(MemoryDatabase):
+        def get_user_stats(self):
+            time.sleep(warm_up_delay)
+            return []
+
+    SlowStatsDatabase().install(db)
+    app = bot.build_application(request=FakeBotApi().request())
+    asyncio.run(webhook_server.serve(
+        app, listen="127.0.0.1", port=port, url_path="hook", webhook_url="https://bench.invalid/hook",
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--import-budget-ms", type=float, default=1000.0)
+    parser.add_argument("--startup-budget-ms", type=float, default=2500.0)
+    parser.add_argument("--warm-up-delay", type=float, default=5.0, help="seconds the stats load is made to take")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-timing", action="store_true", help="report the timings but don't enforce the budgets")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.warm_up_delay)
+        return
+
+    failures = []
+    import_ms, eager = measure_import(args.runs)
+    print(f"import bot: {import_ms:.0f} ms (budget {args.import_budget_ms:.0f} ms)")
+    if import_ms > args.import_budget_ms and not args.no_timing:
+        failures.append(f"import takes {import_ms:.0f} ms, budget is {args.import_budget_ms:.0f} ms")
+    if eager:
+        failures.append(f"imported at boot but should be lazy: {', '.join(eager)}")
+
+    startup_ms = measure_startup(args.warm_up_delay)
+    print(f"spawn to serving: {startup_ms:.0f} ms (budget {args.startup_budget_ms:.0f} ms)")
+    if startup_ms > args.startup_budget_ms and not args.no_timing:
+        failures.append(f"startup takes {startup_ms:.0f} ms, budget is {args.startup_budget_ms:.0f} ms")
+    if startup_ms >= args.warm_up_delay * 1000:
+        failures.append("the webhook only started serving after warm-up finished")
+
+    if failures:
+        print("\nFAILED:\n" + "\n".join(failures))
+        sys.exit(1)
+    print("\nStartup checks passed." if args.no_timing else "\nStartup is within budget.")
+
+
+if __name__ == "__main__":
+    main()
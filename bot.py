@@ -1,12 +1,29 @@
 import logging
-import pandas as pd
 import os
 import asyncio
+import random
+import io
+import tempfile
 import database as db
+from answer_queue import AnswerWriter
+from poll_registry import PollRegistry
+from poll_stats import PollStatsAggregator, format_summary, rank_scores
+from leaderboard_cache import LeaderboardCache
+from dispatcher import PollDispatcher
+from sessions import FINISHED, RUNNING, SCHEDULED, SessionManager, parse_chat_id
+from cluster import Cluster
+from quiz_sheet import read_questions
+from quiz_validation import format_report, validate_sheet
+from user_stats import UserStatsIndex
+import metrics
+from metrics import ANSWERS_INGESTED, HANDLER_SECONDS, ROWS_SKIPPED
+import webhook_server
 import uuid
+from datetime import datetime, time, timedelta, timezone
 import re
 from telegram.helpers import escape_markdown
 from telegram import Update
+from telegram.error import TelegramError
 from telegram.ext import (
     ApplicationBuilder,
     MessageHandler,
@@ -20,6 +37,24 @@ from telegram.ext import (
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 GROUP_CHAT_ID = os.getenv("GROUP_CHAT_ID")
 ADMIN_USER_IDS = os.getenv("ADMIN_USER_IDS")  # Comma-separated list of admin IDs
+# Uploads up to this many bytes are parsed from memory; larger ones are spilled to a temp file
+UPLOAD_MEMORY_LIMIT = int(os.getenv("UPLOAD_MEMORY_LIMIT", str(10 * 1024 * 1024)))
+# Webhook worker processes. With more than one, or CLUSTER=1 when several instances share the
+# database, workers share state through Postgres and only the elected leader sends quizzes.
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+CLUSTER_ENABLED = WEBHOOK_WORKERS > 1 or os.getenv("CLUSTER") == "1"
+# With several workers each serves its own /metrics on METRICS_PORT + worker index (0-based);
+# unset, /metrics is off, as scrapes of the shared port would hit a different worker each time
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Answers per 'answers' cluster message, keeping each well under the NOTIFY payload limit
+ANSWER_DELTA_CHUNK = 100
+# Daily answer_log partition maintenance, as HH:MM UTC
+ANSWER_LOG_MAINTENANCE_AT = os.getenv("ANSWER_LOG_MAINTENANCE_AT", "03:30")
+# Seconds after a quiz's last poll before its results summary is posted, so late answers count
+SESSION_SUMMARY_DELAY = float(os.getenv("SESSION_SUMMARY_DELAY", "60"))
+# Rows in the summary's hardest-questions list and session leaderboard
+SUMMARY_HARDEST = 5
+SUMMARY_LEADERBOARD = 10
 
 # Set up logging
 logging.basicConfig(
@@ -28,6 +63,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Rendered /leaderboard replies, dropped whenever new answers are written
+leaderboard_cache = LeaderboardCache()
+# Poll answers are buffered here and written to the database in batches
+answer_writer = AnswerWriter(on_flush=leaderboard_cache.invalidate_answers)
+# Poll id -> (correct_option_id, session_id, sent_at), backed by the quiz_polls table
+poll_registry = PollRegistry()
+# Live per-poll results and per-session scores for the end-of-quiz summary, flushed to poll_stats
+poll_aggregator = PollStatsAggregator()
+# Rate-limited poll sender, created once the bot is available in post_init
+poll_dispatcher = None
+# Quiz sessions per chat, each sent by its own background task
+sessions = SessionManager()
+# Per-user totals, streaks and ranks for /mystats, loaded at startup and updated on every answer
+user_stats = UserStatsIndex()
+# Answers recorded while user_stats is still loading, replayed once it has loaded
+stats_backlog = []
+# Coordination with the other workers, created in post_init when CLUSTER_ENABLED
+cluster = None
+# Background start-up work that doesn't need to finish before updates are served
+warm_up_task = None
+
+
+def is_leader():
+    """Whether this process sends quizzes and runs maintenance: always, unless it is one of several workers."""
+    return cluster is None or cluster.is_leader
+
 
 def get_admin_ids():
     """Parse admin IDs from environment variable."""
@@ -53,48 +114,27 @@ def escape_markdown_v1(text: str) -> str:
     return text
 
 
-def validate_text_length(text: str, max_length: int, field_name: str) -> bool:
-    """Validates text length and logs warnings if exceeded."""
-    if len(text) > max_length:
-        logger.warning(f"⚠️ {field_name} exceeds {max_length} characters: '{text[:50]}...'")
-        return False
-    return True
-
-
-def get_answer_option_id(answer_english: str, answer_hindi: str) -> int:
-    """
-    Determines the correct option ID from English or Hindi answer text.
-    Returns the option index (0-3) for options A-D.
-    """
-    # Check English answer first
-    if answer_english and answer_english.strip().upper() in ['A', 'B', 'C', 'D']:
-        return ord(answer_english.strip().upper()) - ord('A')
-    
-    # Check Hindi answer patterns
-    if answer_hindi:
-        hindi_answer = answer_hindi.strip()
-        # Common Hindi patterns for options
-        hindi_patterns = {
-            'अ': 0, 'A': 0, 'ए': 0,
-            'ब': 1, 'B': 1, 'बी': 1,
-            'स': 2, 'C': 2, 'सी': 2,
-            'द': 3, 'D': 3, 'डी': 3
-        }
-        
-        for pattern, option_id in hindi_patterns.items():
-            if pattern in hindi_answer:
-                return option_id
-    
-    # Default to option A if unable to parse
-    logger.warning(f"Unable to parse answer: English='{answer_english}', Hindi='{answer_hindi}'. Defaulting to A.")
-    return 0
-
-
 # /start command
+@HANDLER_SECONDS.time(handler="start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("👋 Hi! Please send me your quiz Excel file (.xlsx)")
 
+
+# /dryrun command
+@HANDLER_SECONDS.time(handler="dryrun")
+async def dryrun(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.message.from_user.id):
+        await update.message.reply_text("❌ Sorry, only admins can use this command.")
+        return
+    # The flag travels with the upload: with several workers, or across a redeploy, the upload may be
+    # handled by a process that never saw this command
+    await update.message.reply_text(
+        "🧪 Dry run: send the quiz Excel file with the caption `dryrun` and I'll check it without posting anything.",
+        parse_mode="Markdown",
+    )
+
 # Handle uploaded Excel file
+@HANDLER_SECONDS.time(handler="handle_document")
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     if not is_admin(user_id):
@@ -106,226 +146,665 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Please upload a valid `.xlsx` Excel file.")
         return
 
-    file_path = f"./{file.file_name}"
-    new_file = await file.get_file()
+    try:
+        source = await download_upload(file)
+    except Exception as e:
+        logger.error(f"❌ Error downloading file: {e}")
+        await update.message.reply_text(f"❌ Error: {e}")
+        return
 
+    try:
+        options = parse_quiz_options((update.message.caption or "").split())
+    except ValueError as e:
+        if isinstance(source, str):
+            os.remove(source)
+        await update.message.reply_text(f"⚠️ {e}")
+        return
+
+    if options['dry_run']:
+        status = await update.message.reply_text("🧪 Checking your quiz...")
+        context.application.create_task(send_quiz(context.application, status, None, source, dry_run=True))
+        return
+
+    chat_id = options['chat_id'] or quiz_target_chat(update)
+    session = sessions.create(chat_id, str(uuid.uuid4()), SCHEDULED if options['at'] else RUNNING)
+    if session is None:
+        if isinstance(source, str):
+            os.remove(source)
+        await update.message.reply_text(
+            f"⚠️ A quiz is already running in {chat_id}. Use /stopquiz {chat_id} first."
+        )
+        return
+    message = await update.message.reply_text(
+        f"📄 Processing your quiz for {chat_id}... (Session ID: {session.session_id})"
+    )
+
+    # Parsing runs in the background so this admin's other updates keep being handled
+    status = StatusMessage(context.bot, message.chat_id, message.message_id)
+    context.application.create_task(
+        send_quiz(context.application, status, session, source, at=options['at'])
+    )
+
+
+def quiz_target_chat(update: Update):
+    """Picks the default chat for a quiz: the group the file was uploaded in, else GROUP_CHAT_ID."""
+    chat = update.effective_chat
+    if chat and chat.type in ("group", "supergroup"):
+        return chat.id
+    return parse_chat_id(GROUP_CHAT_ID)
+
+
+def parse_quiz_options(tokens):
+    """
+    Parses quiz options from an upload caption or command arguments: a target chat as a group id
+    (-100123), an @channel or `chat=<id>`, `at=<time>` to schedule the run, `shuffle`, and `dryrun`
+    to only check an upload.
+    Times are ISO 8601 (`2026-10-18T09:00`) or `HH:MM` for the next occurrence; both default to UTC.
+    Raises ValueError for an unreadable time or any other token, so stray numbers in a caption
+    are never taken for a chat.
+    """
+    options = {'chat_id': None, 'at': None, 'shuffle': False, 'dry_run': False}
+    for token in tokens:
+        lowered = token.lower()
+        if lowered.startswith('chat='):
+            options['chat_id'] = parse_chat_target(token[5:])
+        elif re.fullmatch(r'-100\d+|@\w+', token):
+            options['chat_id'] = parse_chat_id(token)
+        elif lowered == 'shuffle':
+            options['shuffle'] = True
+        elif lowered == 'dryrun':
+            options['dry_run'] = True
+        elif lowered.startswith('at='):
+            options['at'] = parse_schedule_time(token[3:])
+        else:
+            raise ValueError(
+                f"Unknown option '{token}'. Use a group id (-100…), @channel, chat=<id>, at=HH:MM, shuffle or dryrun."
+            )
+    return options
+
+
+def parse_chat_target(value):
+    if not re.fullmatch(r'-?\d+|@\w+', value):
+        raise ValueError(f"'{value}' is not a chat id or @channel.")
+    return parse_chat_id(value)
+
+
+def parse_schedule_time(value):
+    now = datetime.now(timezone.utc)
+    try:
+        if len(value) <= 5 and ':' in value:
+            hour, minute = (int(part) for part in value.split(':'))
+            at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            return at if at > now else at + timedelta(days=1)
+        at = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Could not read the time '{value}'. Use at=HH:MM or at=YYYY-MM-DDTHH:MM (UTC).")
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    if at <= now:
+        raise ValueError(f"{at:%Y-%m-%d %H:%M} UTC is in the past.")
+    return at
+
+
+class StatusMessage:
+    """The admin's progress message for a quiz, addressed by id so it survives restarts."""
+
+    def __init__(self, bot, chat_id, message_id):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    async def edit_text(self, text):
+        if self.chat_id is not None:
+            await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+
+    async def reply_text(self, text):
+        if self.chat_id is not None:
+            await self.bot.send_message(self.chat_id, text, reply_to_message_id=self.message_id)
+
+
+async def download_upload(document):
+    """
+    Downloads an uploaded document into memory, or into a unique temp file when it is larger
+    than UPLOAD_MEMORY_LIMIT. Returns a BytesIO or a file path.
+    """
+    new_file = await document.get_file()
+    size = document.file_size or new_file.file_size or 0
+    if size <= UPLOAD_MEMORY_LIMIT:
+        buffer = io.BytesIO()
+        await new_file.download_to_memory(buffer)
+        buffer.seek(0)
+        return buffer
+
+    fd, file_path = tempfile.mkstemp(prefix="quiz-", suffix=".xlsx")
+    os.close(fd)
     try:
         await new_file.download_to_drive(file_path)
-        session_id = str(uuid.uuid4())
-        context.bot_data['current_session_id'] = session_id
-        await update.message.reply_text(f"📄 Processing your quiz... (Session ID: {session_id})")
-
-        df = pd.read_excel(file_path)
-        
-        processed_count = 0
-        skipped_count = 0
-
-        for i, row in df.iterrows():
-            try:
-                # Extract data from the new format
-                question_no = str(row.get("No.", "")).strip()
-                question_english = str(row.get("Question (English)", "")).strip()
-                question_hindi = str(row.get("प्रश्न (Hindi)", "")).strip()
-                
-                # Combine English and Hindi questions
-                question = f"{question_english}"
-                if question_hindi and question_hindi != "nan":
-                    question += f"\n\n{question_hindi}"
-                
-                # Extract options (English and Hindi)
-                options = []
-                option_labels = ['A', 'B', 'C', 'D']
-                
-                for label in option_labels:
-                    option_eng = str(row.get(f"Option {label}", "")).strip()
-                    option_hin = str(row.get(f"विकल्प {label}", "")).strip()
-                    
-                    combined_option = option_eng
-                    if option_hin and option_hin != "nan":
-                        combined_option += f" / {option_hin}"
-                    
-                    options.append(combined_option)
-                
-                # Extract explanations (with Exam Name & Year at the top if available)
-                explanation_english = str(row.get("Explanation (English)", "")).strip()
-                explanation_hindi = str(row.get("व्याख्या (Hindi)", "")).strip()
-                exam_name_year = str(row.get("Exam Name & Year", "")).strip()
-                
-                explanation = ""
-                
-                # Add Exam Name & Year at the top if available
-                if exam_name_year and exam_name_year != "nan":
-                    explanation = f"{exam_name_year}"
-                
-                # Hindi explanation next
-                if explanation_hindi and explanation_hindi != "nan":
-                    if explanation:
-                        explanation += f"{explanation_hindi}"
-                    else:
-                        explanation = explanation_hindi
-                
-                # Then English explanation
-                if explanation_english and explanation_english != "nan":
-                    if explanation:
-                        explanation += f"\n{explanation_english}"
-                    else:
-                        explanation = explanation_english
-                
-                # Extract correct answers
-                answer_english = str(row.get("Answer (English)", "")).strip()
-                answer_hindi = str(row.get("उत्तर (Hindi)", "")).strip()
-                
-                # Validate lengths with stricter Telegram limits
-                # Question: 1-255 characters (leaving buffer for safety)
-                if not validate_text_length(question, 255, f"Question #{question_no}"):
-                    skipped_count += 1
-                    continue
-                
-                # Check if any option exceeds 80 characters (stricter limit for options)
-                option_length_valid = True
-                for j, option in enumerate(options):
-                    if not validate_text_length(option, 80, f"Option {option_labels[j]} for Question #{question_no}"):
-                        option_length_valid = False
-                        break
-                
-                if not option_length_valid:
-                    skipped_count += 1
-                    continue
-                
-                # Validate explanation length (max 200 characters)
-                if explanation and not validate_text_length(explanation, 180, f"Explanation for Question #{question_no}"):
-                    # If explanation is too long, truncate it instead of skipping
-                    explanation = explanation[:180] + "..."
-                    logger.warning(f"⚠️ Truncated explanation for Question #{question_no}")
-                
-                # Additional check: if explanation has more than 2 line breaks, truncate
-                if explanation and explanation.count('\n') > 2:
-                    lines = explanation.split('\n')
-                    explanation = '\n'.join(lines[:3])  # Keep only first 3 lines (2 line breaks)
-                    logger.warning(f"⚠️ Truncated explanation lines for Question #{question_no}")
-                
-                # Validate that we have all required data
-                if not question or not all(opt.strip() for opt in options):
-                    logger.warning(f"⚠️ Skipping question #{question_no}: Missing question or options")
-                    skipped_count += 1
-                    continue
-                
-                # Get correct option ID
-                correct_option_id = get_answer_option_id(answer_english, answer_hindi)
-                
-                # Send poll with explanation
-                try:
-                    message = await context.bot.send_poll(
-                        chat_id=GROUP_CHAT_ID,
-                        question=question,
-                        options=options,
-                        type="quiz",
-                        correct_option_id=correct_option_id,
-                        is_anonymous=False,
-                        explanation=explanation if explanation else None  # This adds the bulb icon with explanation
-                    )
-                    
-                    # Save the correct answer for this poll
-                    context.bot_data[message.poll.id] = (correct_option_id, session_id)
-                    processed_count += 1
-                    
-                    # Slower delay to prevent rate limiting
-                    await asyncio.sleep(2)  # Increased from 1 to 2 seconds
-                    
-                except Exception as poll_error:
-                    if "Flood control exceeded" in str(poll_error) or "Too Many Requests" in str(poll_error):
-                        # Handle rate limiting - wait longer and retry once
-                        logger.warning(f"⚠️ Rate limited at question #{question_no}. Waiting 35 seconds...")
-                        await asyncio.sleep(35)
-                        
-                        try:
-                            # Retry sending the poll
-                            message = await context.bot.send_poll(
-                                chat_id=GROUP_CHAT_ID,
-                                question=question,
-                                options=options,
-                                type="quiz",
-                                correct_option_id=correct_option_id,
-                                is_anonymous=False,
-                                explanation=explanation if explanation else None
-                            )
-                            
-                            context.bot_data[message.poll.id] = (correct_option_id, session_id)
-                            processed_count += 1
-                            logger.info(f"✅ Successfully retried question #{question_no} after rate limit")
-                            
-                        except Exception as retry_error:
-                            logger.error(f"❌ Failed to send question #{question_no} even after retry: {retry_error}")
-                            skipped_count += 1
-                    else:
-                        # Other errors (not rate limiting)
-                        raise poll_error
-                
-            except Exception as e:
-                logger.error(f"❌ Error processing row {i+1}: {e}")
-                skipped_count += 1
-                continue
-
-        # Send summary message
-        summary = f"✅ Quiz processing completed!\n"
-        summary += f"📊 Processed: {processed_count} questions\n"
-        if skipped_count > 0:
-            summary += f"⚠️ Skipped: {skipped_count} questions (length validation failed or missing data)"
-        
-        await update.message.reply_text(summary)
+    except Exception:
+        os.remove(file_path)
+        raise
+    return file_path
+
+
+def load_sheet(source):
+    """Reads and validates the whole sheet; runs in a worker thread."""
+    return validate_sheet(read_questions(source))
+
 
+async def send_quiz(application, status, session, source, dry_run=False, at=None):
+    """
+    Validates the uploaded sheet, stores it in the question bank and persists the quiz run,
+    then hands the run to the JobQueue, immediately or at `at`.
+    """
+    try:
+        report = await asyncio.to_thread(load_sheet, source)
     except Exception as e:
         logger.error(f"❌ Error processing file: {e}")
+        await status.reply_text(f"❌ Error: {e}")
+        if session:
+            session.finish()
+        return
+    finally:
+        if isinstance(source, str):
+            os.remove(source)
+
+    logger.info(
+        f"Validated sheet: {len(report.polls)} ready, {len(report.rejected)} rejected, "
+        f"{len(report.warnings)} warnings"
+    )
+    hashes = [poll['hash'] for poll in report.polls]
+    if dry_run:
+        known = await db.run(db.known_questions, hashes)
+        await status.reply_text(format_report(report, known=len(known)))
+        return
+
+    try:
+        new_count = await db.run(db.save_questions, report.polls)
+        await db.run(
+            db.save_quiz_session, session.session_id, session.chat_id, hashes, session.state, at,
+            status.chat_id, status.message_id
+        )
+    except Exception as e:
+        logger.error(f"❌ Error saving quiz {session.session_id}: {e}")
+        await status.reply_text(f"❌ Error: {e}")
+        session.finish()
+        return
+
+    ROWS_SKIPPED.inc(len(report.rejected), reason="invalid")
+    notes = ""
+    if report.rejected or report.warnings:
+        notes = format_report(report, limit=10, known=len(report.polls) - new_count)
+    if at:
+        await status.edit_text(f"⏰ {len(report.polls)} questions scheduled for {at:%Y-%m-%d %H:%M} UTC in {session.chat_id}. (Session ID: {session.session_id})")
+    queue_quiz_run(application, session, at, len(report.rejected), notes)
+
+
+def queue_quiz_run(application, session, at=None, skipped_count=0, notes=""):
+    """Schedules a persisted quiz run here if this is the leader, and tells the other workers about it."""
+    if is_leader():
+        schedule_quiz(application.job_queue, session.session_id, at, skipped_count, notes)
+    if cluster:
+        cluster.publish('run', {
+            'session_id': session.session_id,
+            'chat_id': session.chat_id,
+            'state': session.state,
+            'at': at.isoformat() if at else None,
+            'skipped': skipped_count,
+            'notes': notes[:2000],
+        })
+
+
+async def on_quiz_run(application, data):
+    """
+    Another worker has persisted a quiz run: the leader takes it over and schedules it,
+    followers keep a copy of the session for /leaderboard session and the control commands.
+    """
+    if not is_leader():
+        sessions.track(data['chat_id'], data['session_id'], data['state'])
+        return
+    session = sessions.get(data['chat_id'])
+    if session is None or session.session_id != data['session_id']:
+        session = sessions.create(data['chat_id'], data['session_id'], data['state'])
+    if session is None:
+        logger.warning(f"⚠️ Chat {data['chat_id']} already has a quiz, not starting {data['session_id']}")
+        await db.run(db.set_quiz_session_status, data['session_id'], FINISHED)
+        cluster.publish('session', {'session_id': data['session_id'], 'chat_id': data['chat_id'], 'state': FINISHED})
+        return
+    at = datetime.fromisoformat(data['at']) if data['at'] else None
+    schedule_quiz(application.job_queue, session.session_id, at, data['skipped'], data['notes'])
+
+
+def publish_session(session, state=None):
+    """Tells the other workers about a session's new state so their copies follow it."""
+    if cluster:
+        cluster.publish('session', {
+            'session_id': session.session_id, 'chat_id': session.chat_id, 'state': state or session.state,
+        })
+
+
+def on_session_state(application, data):
+    """Applies another worker's session state change; the leader also drops a stopped run's pending job."""
+    session = sessions.get(data['chat_id'])
+    if session is None or session.session_id != data['session_id']:
+        if data['state'] == FINISHED:
+            return
+        session = sessions.track(data['chat_id'], data['session_id'], data['state'])
+    session.apply(data['state'])
+    if data['state'] == FINISHED and is_leader():
+        for job in application.job_queue.get_jobs_by_name(f"quiz:{session.session_id}"):
+            job.schedule_removal()
+
+
+def schedule_quiz(job_queue, session_id, at=None, skipped_count=0, notes=""):
+    """Queues a persisted quiz run on the JobQueue, to start at `at` or right away, unless it is already queued."""
+    if job_queue.get_jobs_by_name(f"quiz:{session_id}"):
+        return
+    job_queue.run_once(
+        run_quiz_job,
+        when=at or 0,
+        data={'session_id': session_id, 'skipped': skipped_count, 'notes': notes},
+        name=f"quiz:{session_id}",
+    )
+
+
+async def run_quiz_job(context: ContextTypes.DEFAULT_TYPE):
+    """Starts (or resumes) sending a persisted quiz run from its saved cursor."""
+    data = context.job.data
+    session_id = data['session_id']
+    row = await db.run(db.get_quiz_session, session_id)
+    session = sessions.get(row['chat_id']) if row else None
+    if not row or row['status'] == FINISHED or not session or session.session_id != session_id:
+        logger.warning(f"⚠️ Quiz run {session_id} is no longer pending, not starting it")
+        return
+    if session.state == FINISHED:
+        # Stopped while it was waiting for its start time
+        return
+
+    if session.state == SCHEDULED:
+        session.start()
+        await db.run(db.set_quiz_session_status, session_id, RUNNING)
+        publish_session(session)
+
+    polls = await db.run(db.get_questions, row['question_hashes'])
+    status = StatusMessage(
+        context.bot,
+        parse_chat_id(row['status_chat_id']) if row['status_chat_id'] else None,
+        row['status_message_id'],
+    )
+    if row['next_index']:
+        await status.reply_text(f"🔄 Resuming quiz from question {row['next_index'] + 1} of {len(polls)}.")
+    if session.task and not session.task.done():
+        # Another run_quiz_job for this session got here first while this one was awaiting
+        return
+    sessions.launch(
+        session,
+        dispatch_quiz(
+            status, session, polls, data.get('skipped', 0), data.get('notes', ""), start=row['next_index'],
+            job_queue=context.job_queue,
+        ),
+        context.application.create_task,
+    )
+
+
+async def dispatch_quiz(status, session, polls, skipped_count=0, notes="", start=0, job_queue=None):
+    """
+    Sends polls[start:] to the session's chat while keeping the admin's status message up to date.
+    Each confirmed send moves the persisted cursor, so a restarted run picks up after the last sent poll.
+    Once every poll has been sent, a results summary is queued on `job_queue`.
+    """
+    session_id = session.session_id
+    session.total = len(polls)
+    # Questions missing from the bank come back as None and are skipped
+    pending = [dict(poll, position=i) for i, poll in enumerate(polls) if i >= start and poll is not None]
+    missing = sum(1 for poll in polls[start:] if poll is None)
+    ROWS_SKIPPED.inc(missing, reason="missing")
+    skipped_count += missing
+
+    async def on_sent(poll, message):
+        # Save the correct answer for this poll and advance the cursor
+        sent_at = datetime.now(timezone.utc).timestamp()
+        await poll_registry.register(message.poll.id, poll['correct_option_id'], session_id, poll['position'], sent_at)
+        if cluster:
+            cluster.publish('poll', {
+                'poll_id': message.poll.id, 'correct_option_id': poll['correct_option_id'], 'session_id': session_id,
+                'sent_at': sent_at,
+            })
+
+    async def on_progress(sent, failed, total):
+        session.sent, session.failed = start + sent, failed
+        try:
+            await status.edit_text(
+                f"📤 Sent {start + sent}/{len(polls)} questions" + (f" ({failed} failed)" if failed else "")
+            )
+        except TelegramError as e:
+            logger.warning(f"⚠️ Could not update progress message: {e}")
+
+    try:
+        processed_count, failed_count = await poll_dispatcher.run(
+            session.chat_id, pending, on_sent, on_progress, checkpoint=session.checkpoint
+        )
+    except Exception as e:
+        logger.error(f"❌ Error sending quiz {session_id}: {e}")
+        await status.reply_text(f"❌ Error: {e}")
+        return
+    await db.run(db.set_quiz_session_status, session_id, FINISHED)
+    publish_session(session, FINISHED)
+    ROWS_SKIPPED.inc(failed_count, reason="send_failed")
+    skipped_count += failed_count
+
+    # Send summary message
+    if session.state == FINISHED:
+        summary = f"🛑 Quiz stopped.\n"
+    else:
+        summary = f"✅ Quiz processing completed!\n"
+        if job_queue is not None:
+            job_queue.run_once(
+                post_session_summary,
+                when=SESSION_SUMMARY_DELAY,
+                data={'session_id': session_id, 'chat_id': session.chat_id, 'resumed': start > 0},
+                name=f"summary:{session_id}",
+            )
+    summary += f"📊 Processed: {start + processed_count} questions\n"
+    if skipped_count > 0:
+        summary += f"⚠️ Skipped: {skipped_count} questions (length validation failed, missing data or send errors)\n"
+    if notes:
+        summary += "\n" + notes
+
+    await status.reply_text(summary)
+
+
+async def post_session_summary(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Posts the hardest questions and the session leaderboard to the quiz chat, from the poll_stats
+    aggregates and the scores tallied as answers arrived. A run resumed after a restart missed the
+    earlier answers in memory, so its leaderboard falls back to the session leaderboard query.
+    """
+    data = context.job.data
+    session_id = data['session_id']
+    try:
+        await poll_aggregator.flush()
+        polls = await db.run(db.get_session_poll_stats, session_id)
+        scores = poll_aggregator.scores(session_id)
+        if data['resumed'] or scores is None:
+            ranked = await db.run(db.get_leaderboard, session_id=session_id, limit=SUMMARY_LEADERBOARD)
+        else:
+            ranked = rank_scores(scores, SUMMARY_LEADERBOARD)
+    except Exception as e:
+        logger.error(f"❌ Could not build the summary of quiz {session_id}: {e}")
+        return
+    if not polls and not ranked:
+        return
+    try:
+        await context.bot.send_message(
+            data['chat_id'], format_summary(session_id, polls, ranked, hardest=SUMMARY_HARDEST)
+        )
+    except TelegramError as e:
+        logger.error(f"❌ Could not post the summary of quiz {session_id}: {e}")
+
+
+# /rerun command
+@HANDLER_SECONDS.time(handler="rerun")
+async def rerun(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Re-sends an earlier quiz straight from the question bank: /rerun <session_id> [-100…|@channel|chat=<id>] [at=HH:MM] [shuffle]."""
+    if not is_admin(update.message.from_user.id):
+        await update.message.reply_text("❌ Sorry, only admins can start a new quiz.")
+        return
+    if not context.args:
+        await update.message.reply_text("Usage: /rerun <session_id> [-100…|@channel|chat=<id>] [at=HH:MM] [shuffle]")
+        return
+
+    source_session_id = context.args[0]
+    try:
+        options = parse_quiz_options(context.args[1:])
+    except ValueError as e:
+        await update.message.reply_text(f"⚠️ {e}")
+        return
+    if options['dry_run']:
+        await update.message.reply_text("⚠️ dryrun only applies to uploaded files.")
+        return
+    chat_id = options['chat_id'] or parse_chat_id(GROUP_CHAT_ID)
+
+    hashes = await db.run(db.get_quiz_session_questions, source_session_id)
+    if not hashes:
+        await update.message.reply_text(f"No quiz found with Session ID {source_session_id}.")
+        return
+    polls = [poll for poll in await db.run(db.get_questions, hashes) if poll is not None]
+    if options['shuffle']:
+        random.shuffle(polls)
+
+    session = sessions.create(chat_id, str(uuid.uuid4()), SCHEDULED if options['at'] else RUNNING)
+    if session is None:
+        await update.message.reply_text(f"⚠️ A quiz is already running in {chat_id}. Use /stopquiz {chat_id} first.")
+        return
+    when = f" at {options['at']:%Y-%m-%d %H:%M} UTC" if options['at'] else ""
+    try:
+        message = await update.message.reply_text(
+            f"🔁 Re-running {len(polls)} questions in {chat_id}{when}... (Session ID: {session.session_id})"
+        )
+        await db.run(
+            db.save_quiz_session, session.session_id, chat_id, [poll['hash'] for poll in polls], session.state,
+            options['at'], message.chat_id, message.message_id
+        )
+    except Exception as e:
+        logger.error(f"❌ Error saving quiz {session.session_id}: {e}")
+        # Otherwise the chat would refuse new quizzes until /stopquiz
+        session.finish()
         await update.message.reply_text(f"❌ Error: {e}")
+        return
+    queue_quiz_run(context.application, session, options['at'])
+
+
+async def load_user_stats():
+    """Fills the /mystats index from Postgres, then applies the answers recorded while it was loading."""
+    global stats_backlog
+    try:
+        rows = await db.run(db.get_user_stats)
+        for user_id, username, correct, wrong, current_streak, best_streak in rows:
+            user_stats.load(user_id, username, correct, wrong, current_streak, best_streak)
+        logger.info(f"Loaded stats for {len(user_stats)} users")
     finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        backlog, stats_backlog = stats_backlog, None
+        for answer in backlog:
+            user_stats.record(*answer)
+
+
+def record_stats(user_id, username, is_correct):
+    if stats_backlog is not None:
+        stats_backlog.append((user_id, username, is_correct))
+    else:
+        user_stats.record(user_id, username, is_correct)
+
+
+async def restore_quiz_runs(application):
+    """Re-registers unfinished quiz runs after a restart and queues them to continue from their cursors."""
+    now = datetime.now(timezone.utc)
+    for row in await db.run(db.get_unfinished_quiz_sessions):
+        session = sessions.get(row['chat_id'])
+        if application.job_queue.get_jobs_by_name(f"quiz:{row['session_id']}") or (
+            session and session.session_id == row['session_id'] and session.task and not session.task.done()
+        ):
+            # Already queued or sending, e.g. uploaded while this worker was still warming up
+            continue
+        if session and session.session_id == row['session_id'] and session.state != FINISHED:
+            # The copy this worker kept while another worker was the leader
+            session.apply(row['status'])
+        else:
+            session = sessions.create(row['chat_id'], row['session_id'], row['status'])
+        if session is None:
+            logger.warning(f"⚠️ Chat {row['chat_id']} already has a quiz, leaving {row['session_id']} unfinished")
+            continue
+        at = row['scheduled_at'] if row['status'] == SCHEDULED and row['scheduled_at'] and row['scheduled_at'] > now else None
+        schedule_quiz(application.job_queue, row['session_id'], at)
+        logger.info(f"Restored quiz run {row['session_id']} ({row['status']}, next question {row['next_index'] + 1})")
 
 
 # Handle poll answers
+@HANDLER_SECONDS.time(handler="handle_poll_answer")
 async def handle_poll_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles a user's answer to a poll."""
     answer = update.poll_answer
     user = answer.user
     poll_id = answer.poll_id
 
-    if poll_id in context.bot_data:
-        correct_option_id, session_id = context.bot_data[poll_id]
-        is_correct = answer.option_ids[0] == correct_option_id
-        db.log_answer(user.id, user.username, is_correct, session_id)
+    if not answer.option_ids:
+        # A retracted vote; quiz polls don't allow retracting, so there is no scored answer to undo
+        return
+
+    entry = await poll_registry.lookup(poll_id)
+    if entry:
+        correct_option_id, session_id, sent_at = entry
+        option_id = answer.option_ids[0]
+        is_correct = option_id == correct_option_id
+        answer_writer.submit(user.id, user.username, is_correct, session_id)
+        record_stats(user.id, user.username, is_correct)
+        poll_aggregator.record(
+            poll_id, session_id, correct_option_id, option_id,
+            datetime.now(timezone.utc).timestamp() - sent_at if sent_at else None,
+            user.id, user.username,
+        )
+        ANSWERS_INGESTED.inc()
 
 
 # /leaderboard command
+@HANDLER_SECONDS.time(handler="leaderboard")
 async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
-        await update.message.reply_text("Please specify a time frame (daily, weekly, monthly, all) or 'session' for the last quiz.")
+        await update.message.reply_text("Please specify a time frame (daily, weekly, monthly, all) or 'session' for the last quiz, optionally followed by a page number.")
         return
 
     arg = context.args[0].lower()
 
+    page = 1
+    if len(context.args) > 1:
+        if not context.args[1].isdigit() or int(context.args[1]) < 1:
+            await update.message.reply_text("Page must be a positive number.")
+            return
+        page = int(context.args[1])
+
     if arg == 'session':
-        session_id = context.bot_data.get('current_session_id')
-        if not session_id:
+        # The session for this chat, or the most recent one anywhere (e.g. when asked in a private chat)
+        session = sessions.get(update.effective_chat.id) or sessions.latest()
+        if not session:
             await update.message.reply_text("No active quiz session found.")
             return
-        leaderboard_data = db.get_leaderboard(session_id=session_id)
-        message = f"🏆 *Current Session Leaderboard* 🏆\n\n"
+        session_id = session.session_id
+        title = "Current Session Leaderboard"
     elif arg in ['daily', 'weekly', 'monthly', 'all']:
-        leaderboard_data = db.get_leaderboard(time_frame=arg)
-        message = f"🏆 *{arg.capitalize()} Leaderboard* 🏆\n\n"
+        session_id = None
+        title = f"{arg.capitalize()} Leaderboard"
     else:
         await update.message.reply_text("Invalid argument. Please use 'daily', 'weekly', 'monthly', 'all', or 'session'.")
         return
 
+    cached = leaderboard_cache.get(arg, session_id, page)
+    if cached is None:
+        offset = (page - 1) * db.LEADERBOARD_PAGE_SIZE
+        if session_id:
+            leaderboard_data = await db.run(db.get_leaderboard, session_id=session_id, offset=offset)
+        else:
+            leaderboard_data = await db.run(db.get_leaderboard, time_frame=arg, offset=offset)
+        cached = render_leaderboard(title, leaderboard_data, arg, page)
+        leaderboard_cache.set(arg, session_id, cached, page)
+
+    message, parse_mode = cached
+    await update.message.reply_text(message, parse_mode=parse_mode)
+
+
+# /mystats command
+@HANDLER_SECONDS.time(handler="mystats")
+async def mystats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    if stats_backlog is not None:
+        await update.message.reply_text("⏳ Stats are still loading, please try again in a moment.")
+        return
+    stats = user_stats.get(user.id)
+    if not stats:
+        await update.message.reply_text("You haven't answered any quiz questions yet.")
+        return
+
+    answered = stats['correct'] + stats['wrong']
+    accuracy = 100 * stats['correct'] / answered if answered else 0
+    await update.message.reply_text(
+        f"📊 Stats for {user.username or user.full_name}\n\n"
+        f"🏆 Rank: #{stats['rank']} of {stats['users']}\n"
+        f"✅ Correct: {stats['correct']}\n"
+        f"❌ Wrong: {stats['wrong']}\n"
+        f"🎯 Accuracy: {accuracy:.1f}%\n"
+        f"🔥 Current streak: {stats['current_streak']}\n"
+        f"⭐ Best streak: {stats['best_streak']}"
+    )
+
+
+def render_leaderboard(title, leaderboard_data, arg, page):
+    """Builds one leaderboard page as (text, parse_mode)."""
     if not leaderboard_data:
-        await update.message.reply_text(f"No data available for the selected leaderboard.")
+        return "No data available for the selected leaderboard.", None
+
+    message = f"🏆 *{title}* 🏆\n"
+    if page > 1:
+        message += f"Page {page}\n"
+    message += "\n"
+    for row in leaderboard_data:
+        username = escape_markdown_v1(str(row.get('username') or 'Unknown'))
+        message += f"{row['rank']}. {username} - {row['correct']} correct, {row['wrong']} wrong\n"
+    if len(leaderboard_data) == db.LEADERBOARD_PAGE_SIZE:
+        message += f"\nMore: /leaderboard {arg} {page + 1}"
+    return message, 'Markdown'
+
+
+def resolve_session_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Chat id from the command argument, else the current chat if it has a session, else GROUP_CHAT_ID."""
+    if context.args:
+        return parse_chat_id(context.args[0])
+    if sessions.get(update.effective_chat.id):
+        return update.effective_chat.id
+    return parse_chat_id(GROUP_CHAT_ID)
+
+
+# /pausequiz, /resumequiz and /stopquiz commands
+@HANDLER_SECONDS.time(handler="control_quiz")
+async def control_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.message.from_user.id):
+        await update.message.reply_text("❌ Sorry, only admins can use this command.")
+        return
+
+    command = update.message.text.split()[0].lstrip('/').split('@')[0].lower()
+    chat_id = resolve_session_chat(update, context)
+    session = sessions.active(chat_id)
+    if not session:
+        await update.message.reply_text(f"No running quiz in {chat_id}.")
         return
 
-    for i, row in enumerate(leaderboard_data):
-        username = escape_markdown_v1(str(row.get('username', 'Unknown')))
-        message += f"{i+1}. {username} - {row['correct']} correct, {row['wrong']} wrong\n"
+    if command == 'pausequiz':
+        changed, verb = session.pause(), "paused"
+    elif command == 'resumequiz':
+        changed, verb = session.resume(), "resumed"
+    else:
+        session.finish()
+        changed, verb = True, "stopped"
+        # A run still waiting for its start time never gets to the dispatcher
+        for job in context.job_queue.get_jobs_by_name(f"quiz:{session.session_id}"):
+            job.schedule_removal()
+
+    if changed:
+        await db.run(db.set_quiz_session_status, session.session_id, session.state)
+        publish_session(session)
+        await update.message.reply_text(f"Quiz in {chat_id} {verb}.")
+    else:
+        await update.message.reply_text(f"Quiz in {chat_id} is already {session.state}.")
+
 
-    await update.message.reply_text(message, parse_mode='Markdown')
+# /quizzes command
+@HANDLER_SECONDS.time(handler="list_quizzes")
+async def list_quizzes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not is_admin(update.message.from_user.id):
+        await update.message.reply_text("❌ Sorry, only admins can use this command.")
+        return
+    quiz_sessions = sessions.all()
+    if not quiz_sessions:
+        await update.message.reply_text("No quiz sessions yet.")
+        return
+    await update.message.reply_text("\n".join(session.describe() for session in quiz_sessions))
 
 
 def escape_markdown_v2(text: str) -> str:
@@ -344,6 +823,7 @@ def escape_markdown_v2(text: str) -> str:
     return text
 
 # Also update your groupinfo function to handle member_count properly:
+@HANDLER_SECONDS.time(handler="groupinfo")
 async def groupinfo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     
@@ -392,9 +872,190 @@ async def groupinfo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await update.message.reply_text(details, parse_mode="MarkdownV2")
 
+def on_answers_flushed(rows):
+    """Drops cached leaderboards and sends the answers just written to the other workers."""
+    leaderboard_cache.invalidate_answers(rows)
+    by_session = {}
+    for user_id, username, is_correct, session_id, _timestamp in rows:
+        by_session.setdefault(session_id, []).append([user_id, username, int(is_correct)])
+    for session_id, answers in by_session.items():
+        for i in range(0, len(answers), ANSWER_DELTA_CHUNK):
+            cluster.publish('answers', {'session_id': session_id, 'answers': answers[i:i + ANSWER_DELTA_CHUNK]})
+
+
+def on_remote_answers(data):
+    """Applies answers written by another worker to /mystats, session scores and the leaderboard cache."""
+    rows = [(user_id, username, bool(is_correct), data['session_id'], None)
+            for user_id, username, is_correct in data['answers']]
+    for user_id, username, is_correct, session_id, _timestamp in rows:
+        record_stats(user_id, username, is_correct)
+        poll_aggregator.record_score(session_id, user_id, username, is_correct)
+    leaderboard_cache.invalidate_answers(rows)
+
+
+def register_gauges(application):
+    """Exposes queue depths, cache sizes and pool usage, read whenever /metrics is scraped."""
+    metrics.Gauge("quizbot_answer_queue_depth", "Answers waiting to be written.", callback=answer_writer.qsize)
+    metrics.Gauge("quizbot_answers_flushed", "Answers written since startup.", callback=lambda: answer_writer.flushed)
+    metrics.Gauge("quizbot_answers_dropped", "Answers dropped after failed writes since startup.", callback=lambda: answer_writer.dropped)
+    metrics.Gauge("quizbot_bot_data_size", "Entries in the application's bot_data.", callback=lambda: len(application.bot_data))
+    metrics.Gauge("quizbot_poll_cache_size", "Polls held in the poll registry cache.", callback=lambda: len(poll_registry))
+    metrics.Gauge("quizbot_stats_users", "Users in the /mystats index.", callback=lambda: len(user_stats))
+    metrics.Gauge("quizbot_poll_stats_pending", "Polls with results not yet flushed to poll_stats.", callback=poll_aggregator.pending)
+    metrics.Gauge("quizbot_leader", "1 if this worker sends quizzes and runs maintenance.", callback=lambda: int(is_leader()))
+    metrics.Gauge(
+        "quizbot_polls_pending", "Polls of unfinished sessions not yet sent, by state.", ["state"],
+        callback=pending_polls_by_state,
+    )
+    metrics.Gauge(
+        "quizbot_leaderboard_cache", "Leaderboard cache size and lookups since startup.", ["stat"],
+        callback=lambda: {(k,): v for k, v in leaderboard_cache.stats().items()},
+    )
+    metrics.Gauge(
+        "quizbot_db_pool", "Database pool size, usage and connection wait times.", ["stat"],
+        callback=lambda: {(k,): v for k, v in db.pool_stats().items()},
+    )
+
+
+def pending_polls_by_state():
+    pending = {}
+    for session in sessions.all():
+        if session.state != FINISHED and session.total is not None:
+            pending[(session.state,)] = pending.get((session.state,), 0) + session.total - session.sent - session.failed
+    return pending
+
+
+async def maintain_answer_log(context: ContextTypes.DEFAULT_TYPE):
+    """Daily job: creates upcoming answer_log partitions and archives the ones past retention."""
+    try:
+        retired = await db.run(db.maintain_answer_log)
+    except Exception as e:
+        logger.error(f"❌ answer_log maintenance failed: {e}")
+        return
+    for name in retired:
+        action = "Dropped" if db.ANSWER_LOG_ARCHIVE == 'drop' else "Archived"
+        logger.info(f"🗄️ {action} answer_log partition {name}")
+
+
+def schedule_maintenance(job_queue):
+    """Runs the maintenance once now, off the boot path, and then daily."""
+    hour, minute = (int(part) for part in ANSWER_LOG_MAINTENANCE_AT.split(':'))
+    job_queue.run_once(maintain_answer_log, when=0, name="answer_log_maintenance")
+    job_queue.run_daily(
+        maintain_answer_log, time=time(hour, minute, tzinfo=timezone.utc), name="answer_log_maintenance"
+    )
+
+
+async def become_leader(application):
+    """Takes over the unfinished quiz runs and the daily maintenance."""
+    await restore_quiz_runs(application)
+    schedule_maintenance(application.job_queue)
+
+
+async def step_down(application):
+    """Stops sending quizzes after losing leadership; the new leader resumes them from their cursors."""
+    for job in application.job_queue.jobs():
+        if job.name and (job.name.startswith("quiz:") or job.name == "answer_log_maintenance"):
+            job.schedule_removal()
+    await sessions.shutdown()
+
+
+def start_cluster(application):
+    global cluster
+    cluster = Cluster(on_elected=lambda: become_leader(application), on_demoted=lambda: step_down(application))
+    cluster.subscribe('poll', lambda data: poll_registry.remember(
+        data['poll_id'], data['correct_option_id'], data['session_id'], data.get('sent_at'),
+    ))
+    cluster.subscribe('answers', on_remote_answers)
+    cluster.subscribe('run', lambda data: on_quiz_run(application, data))
+    cluster.subscribe('session', lambda data: on_session_state(application, data))
+    answer_writer.on_flush = on_answers_flushed
+    return cluster.start()
+
+
+async def post_init(application):
+    """
+    Sets up only what handling updates needs, so the webhook starts serving right away;
+    everything else happens in warm_up in the background.
+    """
+    global poll_dispatcher, warm_up_task
+    poll_dispatcher = PollDispatcher(application.bot)
+    register_gauges(application)
+    poll_registry.start()
+    poll_aggregator.start()
+    warm_up_task = asyncio.create_task(warm_up(application))
+
+
+async def warm_up(application):
+    """
+    Loads /mystats, starts writing the answers queued so far, then takes part in leader election
+    (or becomes the leader straight away) to resume quiz runs.
+    """
+    started = asyncio.get_running_loop().time()
+    try:
+        await load_user_stats()
+    except Exception as e:
+        logger.error(f"❌ Could not load user stats: {e}")
+    # Started after the stats query so no answer is both in its results and replayed from the backlog
+    answer_writer.start()
+    try:
+        if CLUSTER_ENABLED:
+            # Elects a leader, which then runs become_leader
+            await start_cluster(application)
+        else:
+            await become_leader(application)
+    except Exception as e:
+        logger.error(f"❌ Could not resume quiz runs: {e}")
+    logger.info(f"Warm-up finished in {asyncio.get_running_loop().time() - started:.2f}s")
+
+
+async def post_shutdown(application):
+    """Drains buffered answers and releases the database pool once the application has stopped."""
+    if warm_up_task and not warm_up_task.done():
+        warm_up_task.cancel()
+        await asyncio.gather(warm_up_task, return_exceptions=True)
+    await sessions.shutdown()
+    await poll_registry.stop()
+    await poll_aggregator.stop()
+    # Not started yet if we are shutting down during warm-up; starting it lets stop() drain the queue
+    answer_writer.start()
+    await answer_writer.stop()
+    logger.info(f"Flushed {answer_writer.flushed} answers, dropped {answer_writer.dropped}")
+    if cluster:
+        # Also releases the leader lock
+        await cluster.stop()
+    logger.info(f"Leaderboard cache: {leaderboard_cache.stats()}")
+    logger.info(f"Closing database pool: {db.pool_stats()}")
+    db.close_pool()
+
+
+def build_application(request=None):
+    """Builds the Application with every handler registered; `request` replaces the Bot API transport (e.g. in benchmarks)."""
+    builder = ApplicationBuilder().token(BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown)
+    if request is not None:
+        builder = builder.request(request)
+    app = builder.build()
+
+    # Register handlers
+    app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("leaderboard", leaderboard))
+    app.add_handler(CommandHandler("groupinfo", groupinfo))
+    app.add_handler(CommandHandler("dryrun", dryrun))
+    app.add_handler(CommandHandler(["pausequiz", "resumequiz", "stopquiz"], control_quiz))
+    app.add_handler(CommandHandler("quizzes", list_quizzes))
+    app.add_handler(CommandHandler("rerun", rerun))
+    app.add_handler(CommandHandler("mystats", mystats))
+    app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
+    app.add_handler(PollAnswerHandler(handle_poll_answer))
+
+    return app
+
+
 # Main entry point
 def main():
-    db.initialize_database()
+    applied = db.initialize_database()
+    if applied:
+        logger.info(f"Applied schema migrations {applied}")
     if not BOT_TOKEN or not GROUP_CHAT_ID:
         raise ValueError("BOT_TOKEN or GROUP_CHAT_ID is not set in environment variables.")
     
@@ -405,27 +1066,39 @@ def main():
     
     logger.info(f"Bot starting with {len(admin_ids)} admin(s): {', '.join(admin_ids)}")
 
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
-
-    # Register handlers
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("leaderboard", leaderboard))
-    app.add_handler(CommandHandler("groupinfo", groupinfo))
-    app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
-    app.add_handler(PollAnswerHandler(handle_poll_answer))
-
     # Set up webhook or polling
     webhook_url = os.getenv("WEBHOOK_URL")
     port = int(os.getenv("PORT", "8443"))
     if webhook_url:
-        app.run_webhook(
+        sockets, worker, metrics_port = None, 0, None
+        if WEBHOOK_WORKERS > 1:
+            if not METRICS_PORT:
+                logger.warning("⚠️ /metrics is disabled with several workers unless METRICS_PORT is set.")
+            # Forked before the pool, its executor or an event loop exist
+            sockets, worker = webhook_server.fork_workers("0.0.0.0", port, WEBHOOK_WORKERS)
+            logger.info(f"Worker {worker + 1} of {WEBHOOK_WORKERS} started (pid {os.getpid()})")
+            if METRICS_PORT:
+                metrics_port = METRICS_PORT + worker
+        db.init_pool()
+        app = build_application()
+        # Our own tornado server, so /metrics is served on the webhook port too (per worker ports with several)
+        asyncio.run(webhook_server.serve(
+            app,
             listen="0.0.0.0",
             port=port,
             url_path=BOT_TOKEN,
-            webhook_url=f"{webhook_url}/{BOT_TOKEN}"
-        )
+            webhook_url=f"{webhook_url}/{BOT_TOKEN}",
+            secret_token=os.getenv("WEBHOOK_SECRET"),
+            sockets=sockets,
+            set_webhook=worker == 0,
+            metrics_port=metrics_port,
+        ))
     else:
         logger.warning("WEBHOOK_URL not set, running in polling mode.")
+        if WEBHOOK_WORKERS > 1:
+            logger.warning("WEBHOOK_WORKERS is ignored in polling mode, which needs a single getUpdates consumer.")
+        db.init_pool()
+        app = build_application()
         app.run_polling()
 
 
@@ -0,0 +1,198 @@
+import asyncio
+import inspect
+import json
+import logging
+import os
+import socket
+
+import database as db
+
+logger = logging.getLogger(__name__)
+
+# Every worker listens on this channel; the holder of the advisory lock is the leader
+CLUSTER_CHANNEL = os.getenv("CLUSTER_CHANNEL", "quizbot")
+CLUSTER_LOCK_ID = int(os.getenv("CLUSTER_LOCK_ID", "724176531"))
+# Followers retry the lock, and the leader checks its connection, this often (seconds)
+CLUSTER_CHECK_INTERVAL = float(os.getenv("CLUSTER_CHECK_INTERVAL", "5"))
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD_BYTES = 7900
+
+
+class Cluster:
+    """
+    Coordinates the workers sharing one database: messages between them go over Postgres
+    LISTEN/NOTIFY, and a session-level advisory lock elects the single leader.
+    The lock is held on its own connection: queries on the listening connection would pull
+    notifications in without its socket becoming readable, leaving them undelivered.
+    `on_elected` and `on_demoted` are awaited when this worker gains or loses the lock.
+    """
+
+    def __init__(self, channel=CLUSTER_CHANNEL, lock_id=CLUSTER_LOCK_ID, on_elected=None, on_demoted=None):
+        self.channel = channel
+        self.lock_id = lock_id
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self.received = 0
+        self._handlers = {}
+        self._conn = None
+        self._fd = None
+        self._lock_conn = None
+        self._outbox = asyncio.Queue()
+        self._tasks = []
+
+    def subscribe(self, kind, handler):
+        """Calls `handler(data)` (a function or coroutine function) for every `kind` message from other workers."""
+        self._handlers[kind] = handler
+
+    def publish(self, kind, data):
+        """Queues a message for every other worker; delivery is asynchronous and best effort."""
+        payload = json.dumps({'kind': kind, 'node': self.node_id, 'data': data}, separators=(',', ':'))
+        if len(payload.encode('utf-8')) > MAX_PAYLOAD_BYTES:
+            raise ValueError(f"{kind} message of {len(payload)} bytes is too large to publish")
+        self._outbox.put_nowait(payload)
+
+    async def start(self):
+        """Connects, starts listening and makes a first attempt at becoming the leader."""
+        await self._connect()
+        await self._check()
+        self._tasks = [asyncio.create_task(self._publish_loop()), asyncio.create_task(self._check_loop())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Anything still queued is sent before the connection (and with it the leader lock) goes away
+        await self._send([])
+        self._disconnect()
+        self._release_lock()
+        self.is_leader = False
+
+    async def _connect(self):
+        conn = await asyncio.to_thread(db.get_db_connection)
+        conn.autocommit = True
+        cursor = conn.cursor()
+        await asyncio.to_thread(cursor.execute, f'LISTEN "{self.channel}"')
+        cursor.close()
+        self._conn = conn
+        # Kept for remove_reader: fileno() raises once psycopg2 has marked a dropped connection closed
+        self._fd = conn.fileno()
+        asyncio.get_running_loop().add_reader(self._fd, self._on_readable)
+        # Notifications that arrived with the LISTEN itself
+        self._deliver()
+        logger.info(f"Cluster node {self.node_id} listening on {self.channel}")
+
+    def _disconnect(self):
+        if self._conn is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            self._conn.close()
+        except Exception:
+            pass
+        finally:
+            self._conn = None
+            self._fd = None
+
+    def _release_lock(self):
+        if self._lock_conn is not None:
+            self._lock_conn.close()
+            self._lock_conn = None
+
+    def _on_readable(self):
+        try:
+            self._conn.poll()
+        except Exception as e:
+            logger.error(f"❌ Cluster connection lost: {e}")
+            self._disconnect()
+            return
+        self._deliver()
+
+    def _deliver(self):
+        while self._conn.notifies:
+            self._dispatch(self._conn.notifies.pop(0).payload)
+
+    def _dispatch(self, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning(f"⚠️ Ignoring malformed cluster message: {payload[:100]}")
+            return
+        if message.get('node') == self.node_id:
+            return
+        handler = self._handlers.get(message.get('kind'))
+        if handler is None:
+            return
+        self.received += 1
+        try:
+            result = handler(message['data'])
+            if inspect.isawaitable(result):
+                asyncio.create_task(self._await_handler(message['kind'], result))
+        except Exception as e:
+            logger.error(f"❌ Failed to handle cluster message {message['kind']}: {e}")
+
+    async def _await_handler(self, kind, result):
+        try:
+            await result
+        except Exception as e:
+            logger.error(f"❌ Failed to handle cluster message {kind}: {e}")
+
+    async def _publish_loop(self):
+        while True:
+            await self._send([await self._outbox.get()])
+
+    async def _send(self, payloads):
+        """Sends `payloads` plus whatever else is queued in one round trip."""
+        while not self._outbox.empty():
+            payloads.append(self._outbox.get_nowait())
+        if not payloads:
+            return
+        try:
+            await db.run(db.notify, self.channel, payloads)
+        except Exception as e:
+            logger.error(f"❌ Failed to publish {len(payloads)} cluster messages: {e}")
+
+    async def _check_loop(self):
+        while True:
+            await asyncio.sleep(CLUSTER_CHECK_INTERVAL)
+            await self._check()
+
+    async def _check(self):
+        """Reconnects lost connections, then tries for the lock as a follower or confirms it as the leader."""
+        if self._conn is None:
+            try:
+                await self._connect()
+            except Exception as e:
+                logger.error(f"❌ Cluster could not listen again: {e}")
+        try:
+            if self._lock_conn is None:
+                # The lock was held by the connection that went away
+                await self._demote()
+                self._lock_conn = await asyncio.to_thread(db.get_db_connection)
+                self._lock_conn.autocommit = True
+            cursor = self._lock_conn.cursor()
+            if self.is_leader:
+                await asyncio.to_thread(cursor.execute, "SELECT 1")
+            else:
+                await asyncio.to_thread(cursor.execute, "SELECT pg_try_advisory_lock(%s)", (self.lock_id,))
+                if cursor.fetchone()[0]:
+                    self.is_leader = True
+                    logger.info(f"👑 Cluster node {self.node_id} is now the leader")
+                    if self.on_elected:
+                        await self.on_elected()
+            cursor.close()
+        except Exception as e:
+            logger.error(f"❌ Cluster check failed: {e}")
+            self._release_lock()
+            await self._demote()
+
+    async def _demote(self):
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        logger.warning(f"⚠️ Cluster node {self.node_id} lost leadership")
+        if self.on_demoted:
+            await self.on_demoted()
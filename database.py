@@ -1,86 +1,856 @@
 import psycopg2
 import os
-from datetime import datetime, timedelta
-from psycopg2.extras import RealDictCursor
+import re
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from psycopg2 import sql
+from psycopg2.extras import Json, RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from metrics import DB_SECONDS
+
+# Rows per leaderboard page
+LEADERBOARD_PAGE_SIZE = int(os.getenv("LEADERBOARD_PAGE_SIZE", "50"))
+
+# answer_log is partitioned by month: partitions exist this many months ahead, and months older than
+# the retention period are compacted into answer_session_totals, then detached into the archive schema
+# (ANSWER_LOG_ARCHIVE=detach) or dropped (ANSWER_LOG_ARCHIVE=drop). A retention of 0 keeps everything.
+ANSWER_LOG_PARTITIONS_AHEAD = int(os.getenv("ANSWER_LOG_PARTITIONS_AHEAD", "3"))
+ANSWER_LOG_RETENTION_MONTHS = int(os.getenv("ANSWER_LOG_RETENTION_MONTHS", "12"))
+ANSWER_LOG_ARCHIVE = os.getenv("ANSWER_LOG_ARCHIVE", "detach")
+ANSWER_LOG_ARCHIVE_SCHEMA = "answer_log_archive"
+_PARTITION_NAME = re.compile(r"^answer_log_p(\d{4})_(\d{2})$")
+
+# Held while migrations are applied; the cluster leader lock uses a different id
+MIGRATION_LOCK_ID = 724176530
+
+# Connection pool settings
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+
+_pool = None
+_pool_slots = None
+_executor = None
+_pool_metrics = {
+    'acquired': 0,
+    'in_use': 0,
+    'waiting': 0,
+    'wait_seconds_total': 0.0,
+    'wait_seconds_max': 0.0,
+}
+_metrics_lock = threading.Lock()
+
 
 def get_db_connection():
     """Establishes a connection to the PostgreSQL database."""
     conn = psycopg2.connect(os.getenv("DATABASE_URL"))
     return conn
 
+
+def init_pool(minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX):
+    """Creates the shared connection pool and the executor that runs queries off the event loop."""
+    global _pool, _pool_slots, _executor
+    if _pool is not None:
+        return
+    _pool = ThreadedConnectionPool(minconn, maxconn, os.getenv("DATABASE_URL"))
+    # One executor thread per connection, so queries queue in run() rather than on the pool.
+    # ThreadedConnectionPool raises instead of blocking when exhausted; the semaphore makes the
+    # rare caller outside run() wait for a connection instead.
+    _pool_slots = threading.BoundedSemaphore(maxconn)
+    _executor = ThreadPoolExecutor(max_workers=maxconn, thread_name_prefix="db")
+
+
+def close_pool():
+    """Waits for in-flight queries and closes every pooled connection."""
+    global _pool, _pool_slots, _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+    if _pool is not None:
+        _pool.closeall()
+    _pool = None
+    _pool_slots = None
+    _executor = None
+
+
+def pool_stats():
+    """
+    Returns a snapshot of pool size and usage, and of the time calls spent queued in run()
+    waiting for a free executor thread (and so a connection).
+    """
+    with _metrics_lock:
+        stats = dict(_pool_metrics)
+    stats['max_size'] = _pool.maxconn if _pool else 0
+    stats['min_size'] = _pool.minconn if _pool else 0
+    stats['open'] = (len(_pool._pool) + len(_pool._used)) if _pool else 0
+    return stats
+
+
+@contextmanager
+def pooled_connection():
+    """Borrows a connection from the pool, falling back to a direct connection if no pool is set up."""
+    if _pool is None:
+        conn = get_db_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    _pool_slots.acquire()
+    with _metrics_lock:
+        _pool_metrics['acquired'] += 1
+        _pool_metrics['in_use'] += 1
+
+    conn = None
+    try:
+        conn = _pool.getconn()
+        yield conn
+    except Exception:
+        if conn is not None:
+            conn.rollback()
+        raise
+    finally:
+        if conn is not None:
+            _pool.putconn(conn, close=conn.closed != 0)
+        _pool_slots.release()
+        with _metrics_lock:
+            _pool_metrics['in_use'] -= 1
+
+
+async def run(func, *args, **kwargs):
+    """Runs a blocking database function on the pool's executor so handlers can await it."""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    queued = [True]
+    with _metrics_lock:
+        _pool_metrics['waiting'] += 1
+
+    def stop_waiting(started_running):
+        with _metrics_lock:
+            if not queued[0]:
+                return
+            queued[0] = False
+            _pool_metrics['waiting'] -= 1
+            if started_running:
+                # Time from submission until an executor thread picked the call up
+                waited = time.perf_counter() - started
+                _pool_metrics['wait_seconds_total'] += waited
+                _pool_metrics['wait_seconds_max'] = max(_pool_metrics['wait_seconds_max'], waited)
+
+    def call():
+        stop_waiting(True)
+        return func(*args, **kwargs)
+
+    try:
+        return await loop.run_in_executor(_executor, call)
+    except asyncio.CancelledError:
+        # Cancelled while still queued, so the call never starts
+        stop_waiting(False)
+        raise
+    finally:
+        DB_SECONDS.observe(time.perf_counter() - started, call=func.__name__)
+
 def initialize_database():
-    """Initializes the database and creates the necessary tables if they don't exist."""
+    """
+    Brings the schema up to date and returns the migration versions applied.
+    When schema_migrations already records the latest version this is a single query and no DDL runs;
+    otherwise the missing migrations are applied in one transaction, under an advisory lock so that
+    workers or instances booting together don't race.
+    """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
+    try:
+        cursor = conn.cursor()
+        if _schema_version(cursor) >= MIGRATIONS[-1][0]:
+            return []
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Another process may have finished migrating while we waited for the lock
+        current = _schema_version(cursor)
+        applied = []
+        for version, description, migrate in MIGRATIONS:
+            if version > current:
+                migrate(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)", (version, description)
+                )
+                applied.append(version)
+        conn.commit()
+        cursor.close()
+        return applied
+    finally:
+        conn.close()
+
+def _schema_version(cursor):
+    cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+def _migrate_base_schema(cursor):
+    """
+    Every table and index as of the introduction of schema_migrations. Each statement is idempotent,
+    so databases created by earlier versions of the bot are brought up to this point as well.
+    """
+    # answer_log from before partitioning is moved aside and copied into the monthly partitions below
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('answer_log')")
+    row = cursor.fetchone()
+    unpartitioned = row is not None and row[0] == 'r'
+    if unpartitioned:
+        cursor.execute("ALTER TABLE answer_log RENAME TO answer_log_unpartitioned")
+        cursor.execute("ALTER TABLE answer_log_unpartitioned RENAME CONSTRAINT answer_log_pkey TO answer_log_unpartitioned_pkey")
+        cursor.execute("ALTER SEQUENCE IF EXISTS answer_log_id_seq RENAME TO answer_log_unpartitioned_id_seq")
+        for index in ('idx_answer_log_session_user', 'idx_answer_log_timestamp_user', 'idx_answer_log_timestamp'):
+            cursor.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(index)))
+
+    # Range partitioned by month; the partition key has to be part of the primary key
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS answer_log (
-            id SERIAL PRIMARY KEY,
+            id BIGSERIAL,
             user_id BIGINT NOT NULL,
             username TEXT,
             is_correct BOOLEAN NOT NULL,
             session_id TEXT NOT NULL,
-            timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+            timestamp TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    ''')
+
+    # Composite indexes for session leaderboards and time-window scans, grouped by user
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_answer_log_session_user ON answer_log (session_id, user_id);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_answer_log_timestamp_user ON answer_log (timestamp, user_id);')
+
+    today = datetime.now(timezone.utc).date()
+    if unpartitioned:
+        cursor.execute("SELECT MIN(timestamp), MAX(timestamp) FROM answer_log_unpartitioned")
+        oldest, newest = cursor.fetchone()
+        if oldest is not None:
+            create_answer_log_partitions(
+                cursor, oldest.astimezone(timezone.utc).date(), max(newest.astimezone(timezone.utc).date(), today)
+            )
+        # Rows without a timestamp (never written by the bot) are filed with the oldest answer
+        cursor.execute('''
+            INSERT INTO answer_log (id, user_id, username, is_correct, session_id, timestamp)
+            SELECT id, user_id, username, is_correct, session_id, COALESCE(timestamp, %s)
+            FROM answer_log_unpartitioned
+        ''', (oldest,))
+        cursor.execute("SELECT setval('answer_log_id_seq', GREATEST((SELECT MAX(id) FROM answer_log), 1))")
+        cursor.execute("DROP TABLE answer_log_unpartitioned")
+    create_answer_log_partitions(cursor, today, _add_months(today, ANSWER_LOG_PARTITIONS_AHEAD))
+
+    # Per-session totals of answers whose answer_log partition has been archived
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS answer_session_totals (
+            session_id TEXT NOT NULL,
+            user_id BIGINT NOT NULL,
+            correct INTEGER NOT NULL DEFAULT 0,
+            wrong INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (session_id, user_id)
         )
     ''')
-    
-    # Add an index to the timestamp column for faster time-based queries
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_answer_log_timestamp ON answer_log (timestamp);')
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
+
+    # Polls sent by the bot, so answers can still be scored after a restart
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS quiz_polls (
+            poll_id TEXT PRIMARY KEY,
+            correct_option_id SMALLINT NOT NULL,
+            session_id TEXT NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_quiz_polls_created_at ON quiz_polls (created_at);')
+
+    # Per-user daily totals, kept up to date as answers are logged so leaderboards never scan answer_log
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS answer_daily_totals (
+            user_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            username TEXT,
+            correct INTEGER NOT NULL DEFAULT 0,
+            wrong INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        )
+    ''')
+    # Covers time-frame leaderboards without touching the heap
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_answer_daily_totals_day_user '
+        'ON answer_daily_totals (day, user_id) INCLUDE (correct, wrong);'
+    )
+    cursor.execute('DROP INDEX IF EXISTS idx_answer_daily_totals_day;')
+
+    # Validated poll payloads keyed by a content hash, so quizzes can be re-run without re-parsing
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS question_bank (
+            question_hash TEXT PRIMARY KEY,
+            payload JSONB NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # The ordered questions of every quiz session
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS quiz_sessions (
+            session_id TEXT PRIMARY KEY,
+            chat_id TEXT NOT NULL,
+            question_hashes TEXT[] NOT NULL,
+            created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Run state: next_index is the cursor past the last poll confirmed sent.
+    # Sessions recorded before runs were persisted count as finished.
+    cursor.execute("ALTER TABLE quiz_sessions ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'finished'")
+    cursor.execute("ALTER TABLE quiz_sessions ADD COLUMN IF NOT EXISTS next_index INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("ALTER TABLE quiz_sessions ADD COLUMN IF NOT EXISTS scheduled_at TIMESTAMPTZ")
+    cursor.execute("ALTER TABLE quiz_sessions ADD COLUMN IF NOT EXISTS status_chat_id TEXT")
+    cursor.execute("ALTER TABLE quiz_sessions ADD COLUMN IF NOT EXISTS status_message_id BIGINT")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_quiz_sessions_unfinished ON quiz_sessions (status) WHERE status <> 'finished'"
+    )
+
+    # First run with existing history: build the rollups once
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM answer_log) AND NOT EXISTS (SELECT 1 FROM answer_daily_totals)"
+    )
+    if cursor.fetchone()[0]:
+        _rebuild_daily_totals(cursor)
+
+def _migrate_poll_stats(cursor):
+    # Which question of its session each poll asked
+    cursor.execute("ALTER TABLE quiz_polls ADD COLUMN IF NOT EXISTS position INTEGER")
+    # Live per-poll results: answer counts per option and per answer-time bucket
+    # (poll_stats.ANSWER_SECONDS_BUCKETS), added to by every worker as answers arrive
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS poll_stats (
+            poll_id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            correct_option_id SMALLINT NOT NULL,
+            option_counts INTEGER[] NOT NULL,
+            answer_seconds INTEGER[] NOT NULL,
+            answers INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_poll_stats_session ON poll_stats (session_id);')
+
+# Applied in order and recorded in schema_migrations: append new (version, description, function)
+# entries and never change one that has shipped
+MIGRATIONS = [
+    (1, "base schema", _migrate_base_schema),
+    (2, "poll_stats and quiz poll positions", _migrate_poll_stats),
+]
+
+def _add_months(day, months):
+    """First day of the month `months` after the month of `day`."""
+    year, month = divmod(day.month - 1 + months, 12)
+    return date(day.year + year, month + 1, 1)
+
+def create_answer_log_partitions(cursor, first, last):
+    """Creates the monthly answer_log partitions covering `first` through `last` (dates) if they are missing."""
+    month = first.replace(day=1)
+    while month <= last:
+        following = _add_months(month, 1)
+        cursor.execute(
+            sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF answer_log FOR VALUES FROM (%s) TO (%s)").format(
+                sql.Identifier(f"answer_log_p{month:%Y_%m}")
+            ),
+            (f"{month} 00:00+00", f"{following} 00:00+00")
+        )
+        month = following
+
+def maintain_answer_log(retention_months=ANSWER_LOG_RETENTION_MONTHS, archive=ANSWER_LOG_ARCHIVE):
+    """
+    Creates upcoming answer_log partitions and retires those older than the retention period.
+    Each retired month is first compacted into answer_session_totals (the daily rollups already hold it),
+    then detached into the archive schema or dropped, in one transaction.
+    Returns the names of the partitions retired.
+    """
+    if archive not in ('detach', 'drop'):
+        raise ValueError(f"ANSWER_LOG_ARCHIVE must be 'detach' or 'drop', not {archive!r}")
+    today = datetime.now(timezone.utc).date()
+    retired = []
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        create_answer_log_partitions(cursor, today, _add_months(today, ANSWER_LOG_PARTITIONS_AHEAD))
+        conn.commit()
+        if retention_months <= 0:
+            cursor.close()
+            return retired
+
+        cutoff = _add_months(today, -retention_months)
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'answer_log'::regclass ORDER BY c.relname"
+        )
+        for (name,) in cursor.fetchall():
+            match = _PARTITION_NAME.match(name)
+            if not match or _add_months(date(int(match[1]), int(match[2]), 1), 1) > cutoff:
+                continue
+            partition = sql.Identifier(name)
+            cursor.execute(sql.SQL('''
+                INSERT INTO answer_session_totals (session_id, user_id, correct, wrong)
+                SELECT session_id, user_id,
+                       COUNT(*) FILTER (WHERE is_correct),
+                       COUNT(*) FILTER (WHERE NOT is_correct)
+                FROM {}
+                GROUP BY session_id, user_id
+                ORDER BY session_id, user_id
+                ON CONFLICT (session_id, user_id) DO UPDATE SET
+                    correct = answer_session_totals.correct + EXCLUDED.correct,
+                    wrong = answer_session_totals.wrong + EXCLUDED.wrong
+            ''').format(partition))
+            cursor.execute(sql.SQL("ALTER TABLE answer_log DETACH PARTITION {}").format(partition))
+            if archive == 'drop':
+                cursor.execute(sql.SQL("DROP TABLE {}").format(partition))
+            else:
+                cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(ANSWER_LOG_ARCHIVE_SCHEMA)))
+                cursor.execute(sql.SQL("ALTER TABLE {} SET SCHEMA {}").format(
+                    partition, sql.Identifier(ANSWER_LOG_ARCHIVE_SCHEMA)
+                ))
+            conn.commit()
+            retired.append(name)
+        cursor.close()
+    return retired
 
 def log_answer(user_id, username, is_correct, session_id):
     """Logs a user's answer in the database."""
+    log_answers([(user_id, username, is_correct, session_id, datetime.now(timezone.utc))])
+
+def log_answers(rows):
+    """
+    Logs a batch of answers with a single multi-row INSERT.
+    Each row is (user_id, username, is_correct, session_id, timestamp).
+    """
+    if not rows:
+        return
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        execute_values(
+            cursor,
+            "INSERT INTO answer_log (user_id, username, is_correct, session_id, timestamp) VALUES %s",
+            rows,
+            page_size=len(rows)
+        )
+        _update_daily_totals(cursor, rows)
+        conn.commit()
+        cursor.close()
+
+def _update_daily_totals(cursor, rows):
+    """Folds a batch of answers into answer_daily_totals in the same transaction as the insert."""
+    totals = {}
+    for user_id, username, is_correct, _session_id, timestamp in rows:
+        key = (user_id, timestamp.astimezone(timezone.utc).date())
+        entry = totals.get(key)
+        if entry is None:
+            entry = totals[key] = [username, 0, 0]
+        entry[0] = username
+        entry[1 if is_correct else 2] += 1
+
+    # Sorted keys keep lock order stable between concurrent flushes
+    values = [(user_id, day, username, correct, wrong)
+              for (user_id, day), (username, correct, wrong) in sorted(totals.items())]
+    execute_values(
+        cursor,
+        '''
+        INSERT INTO answer_daily_totals (user_id, day, username, correct, wrong) VALUES %s
+        ON CONFLICT (user_id, day) DO UPDATE SET
+            username = EXCLUDED.username,
+            correct = answer_daily_totals.correct + EXCLUDED.correct,
+            wrong = answer_daily_totals.wrong + EXCLUDED.wrong
+        ''',
+        values,
+        page_size=len(values)
+    )
+
+def _rebuild_daily_totals(cursor):
+    # SHARE mode blocks new answers while the rollups are rebuilt, so none are double counted or missed
+    cursor.execute("LOCK TABLE answer_log IN SHARE MODE")
+    cursor.execute("SELECT MIN(timestamp) FROM answer_log")
+    (oldest,) = cursor.fetchone()
+    if oldest is None:
+        return
+    # Days before the oldest answer left in answer_log belong to archived partitions and only live on here
+    oldest_day = oldest.astimezone(timezone.utc).date()
+    cursor.execute("DELETE FROM answer_daily_totals WHERE day >= %s", (oldest_day,))
+    cursor.execute('''
+        INSERT INTO answer_daily_totals (user_id, day, username, correct, wrong)
+        SELECT user_id,
+               (timestamp AT TIME ZONE 'UTC')::date AS day,
+               (ARRAY_AGG(username ORDER BY timestamp DESC))[1],
+               COUNT(*) FILTER (WHERE is_correct),
+               COUNT(*) FILTER (WHERE NOT is_correct)
+        FROM answer_log
+        WHERE timestamp >= %s
+        GROUP BY user_id, day
+    ''', (datetime(oldest_day.year, oldest_day.month, oldest_day.day, tzinfo=timezone.utc),))
+
+def backfill_daily_totals():
+    """Rebuilds answer_daily_totals from answer_log, keeping the rollups of archived months."""
     conn = get_db_connection()
     cursor = conn.cursor()
-    
-    cursor.execute(
-        "INSERT INTO answer_log (user_id, username, is_correct, session_id) VALUES (%s, %s, %s, %s)",
-        (user_id, username, is_correct, session_id)
-    )
-    
+    _rebuild_daily_totals(cursor)
     conn.commit()
+    cursor.execute("SELECT COUNT(*) FROM answer_daily_totals")
+    count = cursor.fetchone()[0]
     cursor.close()
     conn.close()
+    return count
 
-def get_leaderboard(time_frame='all', session_id=None):
+def save_poll(poll_id, correct_option_id, session_id, position=None):
     """
-    Retrieves the leaderboard data from the database based on the specified time frame or session_id.
+    Records a sent poll and its correct option.
+    If `position` is given, the session's run cursor is moved past it in the same transaction.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO quiz_polls (poll_id, correct_option_id, session_id, position) VALUES (%s, %s, %s, %s) "
+            "ON CONFLICT (poll_id) DO NOTHING",
+            (poll_id, correct_option_id, session_id, position)
+        )
+        if position is not None:
+            cursor.execute(
+                "UPDATE quiz_sessions SET next_index = GREATEST(next_index, %s) WHERE session_id = %s",
+                (position + 1, session_id)
+            )
+        conn.commit()
+        cursor.close()
 
-    query = "SELECT user_id, username, SUM(CASE WHEN is_correct THEN 1 ELSE 0 END) as correct, SUM(CASE WHEN NOT is_correct THEN 1 ELSE 0 END) as wrong FROM answer_log"
-    
-    conditions = []
+def get_poll(poll_id):
+    """Returns the correct option, session and send time of a poll, or None if it is unknown."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(
+            "SELECT correct_option_id, session_id, created_at FROM quiz_polls WHERE poll_id = %s",
+            (poll_id,)
+        )
+        row = cursor.fetchone()
+        cursor.close()
+    return row
+
+def expire_polls(retention_days):
+    """Deletes polls older than the retention period and returns how many were removed."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM quiz_polls WHERE created_at < NOW() - make_interval(days => %s)",
+            (retention_days,)
+        )
+        deleted = cursor.rowcount
+        conn.commit()
+        cursor.close()
+    return deleted
+
+def _add_arrays(column):
+    return (
+        f"(SELECT array_agg(COALESCE(a, 0) + COALESCE(b, 0) ORDER BY n) "
+        f"FROM unnest(poll_stats.{column}, EXCLUDED.{column}) WITH ORDINALITY AS t(a, b, n))"
+    )
+
+def save_poll_stats(rows):
+    """
+    Adds per-poll deltas into poll_stats. Each row is (poll_id, session_id, correct_option_id,
+    option_counts, answer_seconds, answers, correct); the arrays are added element-wise.
+    """
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        execute_values(
+            cursor,
+            f"""
+            INSERT INTO poll_stats
+                (poll_id, session_id, correct_option_id, option_counts, answer_seconds, answers, correct)
+            VALUES %s
+            ON CONFLICT (poll_id) DO UPDATE SET
+                option_counts = {_add_arrays('option_counts')},
+                answer_seconds = {_add_arrays('answer_seconds')},
+                answers = poll_stats.answers + EXCLUDED.answers,
+                correct = poll_stats.correct + EXCLUDED.correct,
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            rows,
+            template="(%s, %s, %s, %s::integer[], %s::integer[], %s, %s)"
+        )
+        conn.commit()
+        cursor.close()
+
+def get_session_poll_stats(session_id):
+    """Returns the poll_stats rows of a session with each poll's position, label and question text."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(
+            """
+            SELECT s.poll_id, p.position, s.correct_option_id, s.option_counts, s.answer_seconds,
+                   s.answers, s.correct, b.payload->>'label' AS label, b.payload->>'question' AS question
+            FROM poll_stats s
+            LEFT JOIN quiz_polls p ON p.poll_id = s.poll_id
+            LEFT JOIN quiz_sessions q ON q.session_id = s.session_id
+            LEFT JOIN question_bank b ON b.question_hash = q.question_hashes[p.position + 1]
+            WHERE s.session_id = %s
+            ORDER BY p.position
+            """,
+            (session_id,)
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+def get_user_stats():
+    """
+    Returns all-time totals and answer streaks for every user, for loading the in-memory stats index.
+    Totals come from the daily rollups; streaks are runs of consecutive correct answers in answer_log.
+    """
+    query = """
+        WITH totals AS (
+            SELECT user_id,
+                   (ARRAY_AGG(username ORDER BY day DESC))[1] AS username,
+                   SUM(correct) AS correct,
+                   SUM(wrong) AS wrong
+            FROM answer_daily_totals
+            GROUP BY user_id
+        ),
+        ordered AS (
+            SELECT user_id, is_correct,
+                   ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY timestamp, id) AS rn,
+                   ROW_NUMBER() OVER (PARTITION BY user_id, is_correct ORDER BY timestamp, id) AS run_rn
+            FROM answer_log
+        ),
+        last_answer AS (
+            SELECT user_id, MAX(rn) AS last_rn FROM ordered GROUP BY user_id
+        ),
+        runs AS (
+            SELECT user_id, COUNT(*) AS length, MAX(rn) AS end_rn
+            FROM ordered
+            WHERE is_correct
+            GROUP BY user_id, rn - run_rn
+        ),
+        streaks AS (
+            SELECT l.user_id,
+                   COALESCE(MAX(r.length), 0) AS best_streak,
+                   COALESCE(MAX(r.length) FILTER (WHERE r.end_rn = l.last_rn), 0) AS current_streak
+            FROM last_answer l
+            LEFT JOIN runs r ON r.user_id = l.user_id
+            GROUP BY l.user_id
+        )
+        SELECT t.user_id, t.username, t.correct, t.wrong,
+               COALESCE(s.current_streak, 0) AS current_streak,
+               COALESCE(s.best_streak, 0) AS best_streak
+        FROM totals t
+        LEFT JOIN streaks s ON s.user_id = t.user_id
+    """
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query)
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+def leaderboard_query(time_frame='all', session_id=None, offset=0, limit=LEADERBOARD_PAGE_SIZE):
+    """
+    Builds the SQL and parameters for one leaderboard page.
+    Users are grouped by user_id and shown under their latest username; tied scores share a rank.
+    Time frames are read from the daily rollups; only session leaderboards touch answer_log,
+    plus answer_session_totals for sessions whose partitions have been archived.
+    """
     params = []
-    
+
     if session_id:
-        conditions.append("session_id = %s")
-        params.append(session_id)
-    elif time_frame != 'all':
-        now = datetime.utcnow()
-        if time_frame == 'daily':
-            start_date = now - timedelta(days=1)
-        elif time_frame == 'weekly':
-            start_date = now - timedelta(weeks=1)
-        elif time_frame == 'monthly':
-            start_date = now - timedelta(days=30)
-        else: # yearly
-            start_date = now - timedelta(days=365)
-        
-        conditions.append("timestamp >= %s")
-        params.append(start_date)
-
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
-
-    query += " GROUP BY user_id, username ORDER BY correct DESC, wrong ASC LIMIT 100"
-    
-    cursor.execute(query, tuple(params))
-    leaderboard = cursor.fetchall()
-    cursor.close()
-    conn.close()
+        # Answers come after the session was created, which prunes older answer_log partitions;
+        # the day of slack covers clock skew between the bot and the database
+        totals = """
+            SELECT user_id, SUM(correct) AS correct, SUM(wrong) AS wrong
+            FROM (
+                SELECT user_id,
+                       COUNT(*) FILTER (WHERE is_correct) AS correct,
+                       COUNT(*) FILTER (WHERE NOT is_correct) AS wrong
+                FROM answer_log
+                WHERE session_id = %s
+                  AND timestamp >= COALESCE(
+                      (SELECT created_at FROM quiz_sessions WHERE session_id = %s) - INTERVAL '1 day',
+                      '-infinity'
+                  )
+                GROUP BY user_id
+                UNION ALL
+                SELECT user_id, correct, wrong FROM answer_session_totals WHERE session_id = %s
+            ) s
+            GROUP BY user_id
+        """
+        params.extend([session_id, session_id, session_id])
+    else:
+        totals = "SELECT user_id, SUM(correct) AS correct, SUM(wrong) AS wrong FROM answer_daily_totals"
+        if time_frame != 'all':
+            today = datetime.now(timezone.utc).date()
+            if time_frame == 'daily':
+                start_day = today
+            elif time_frame == 'weekly':
+                start_day = today - timedelta(days=6)
+            elif time_frame == 'monthly':
+                start_day = today - timedelta(days=29)
+            else: # yearly
+                start_day = today - timedelta(days=364)
+            totals += " WHERE day >= %s"
+            params.append(start_day)
+        totals += " GROUP BY user_id"
+
+    # Rank and page first, then look up the latest username only for the rows being shown
+    query = f"""
+        WITH totals AS ({totals}),
+        ranked AS (
+            SELECT user_id, correct, wrong,
+                   RANK() OVER (ORDER BY correct DESC, wrong ASC) AS rank
+            FROM totals
+            ORDER BY rank, user_id
+            LIMIT %s OFFSET %s
+        )
+        SELECT r.user_id, u.username, r.correct, r.wrong, r.rank
+        FROM ranked r
+        LEFT JOIN LATERAL (
+            SELECT username FROM answer_daily_totals d
+            WHERE d.user_id = r.user_id
+            ORDER BY d.day DESC
+            LIMIT 1
+        ) u ON TRUE
+        ORDER BY r.rank, r.user_id
+    """
+    params.extend([limit, offset])
+    return query, tuple(params)
+
+def known_questions(hashes):
+    """Returns the subset of question hashes already in the question bank."""
+    if not hashes:
+        return set()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT question_hash FROM question_bank WHERE question_hash = ANY(%s)", (list(hashes),))
+        known = {row[0] for row in cursor.fetchall()}
+        cursor.close()
+    return known
+
+def save_questions(polls):
+    """
+    Adds validated polls to the question bank, keyed by poll['hash'].
+    Questions already in the bank take the uploaded payload, so a re-upload that fixes an
+    explanation or label is what gets sent. Returns how many were new.
+    """
+    if not polls:
+        return 0
+    values = [(poll['hash'], Json({k: v for k, v in poll.items() if k != 'hash'})) for poll in polls]
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        new = execute_values(
+            cursor,
+            '''
+            INSERT INTO question_bank (question_hash, payload) VALUES %s
+            ON CONFLICT (question_hash) DO UPDATE SET payload = EXCLUDED.payload, last_used_at = CURRENT_TIMESTAMP
+            RETURNING (xmax = 0)
+            ''',
+            values,
+            page_size=len(values),
+            fetch=True
+        )
+        conn.commit()
+        cursor.close()
+    return sum(1 for (inserted,) in new if inserted)
+
+def get_questions(hashes):
+    """Returns the stored poll payloads for the given hashes, in the same order; unknown hashes come back as None."""
+    if not hashes:
+        return []
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT question_hash, payload FROM question_bank WHERE question_hash = ANY(%s)",
+            (list(hashes),)
+        )
+        payloads = {question_hash: dict(payload, hash=question_hash) for question_hash, payload in cursor.fetchall()}
+        cursor.close()
+    return [payloads.get(h) for h in hashes]
+
+def save_quiz_session(session_id, chat_id, hashes, status='running', scheduled_at=None,
+                      status_chat_id=None, status_message_id=None):
+    """Records a quiz run: its ordered questions, state, schedule and the admin message reporting on it."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO quiz_sessions (session_id, chat_id, question_hashes, status, scheduled_at, "
+            "status_chat_id, status_message_id) VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            (session_id, str(chat_id), list(hashes), status, scheduled_at,
+             None if status_chat_id is None else str(status_chat_id), status_message_id)
+        )
+        conn.commit()
+        cursor.close()
+
+def get_quiz_session(session_id):
+    """Returns a quiz run row, or None if the session is unknown."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute("SELECT * FROM quiz_sessions WHERE session_id = %s", (session_id,))
+        row = cursor.fetchone()
+        cursor.close()
+    return row
+
+def get_quiz_session_questions(session_id):
+    """Returns the ordered question hashes of a quiz session, or None if the session is unknown."""
+    row = get_quiz_session(session_id)
+    return row['question_hashes'] if row else None
+
+def get_unfinished_quiz_sessions():
+    """Returns every quiz run that is scheduled, running or paused, oldest first."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute("SELECT * FROM quiz_sessions WHERE status <> 'finished' ORDER BY created_at")
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+def set_quiz_session_status(session_id, status):
+    """Updates the persisted state of a quiz run."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE quiz_sessions SET status = %s WHERE session_id = %s", (status, session_id))
+        conn.commit()
+        cursor.close()
+
+def notify(channel, payloads):
+    """Sends each payload as a NOTIFY on `channel`, in order, in one transaction."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) WITH ORDINALITY AS p(payload, n) ORDER BY n",
+            (channel, list(payloads))
+        )
+        conn.commit()
+        cursor.close()
+
+def get_leaderboard(time_frame='all', session_id=None, offset=0, limit=LEADERBOARD_PAGE_SIZE):
+    """Retrieves one page of the leaderboard for the specified time frame or session_id."""
+    query, params = leaderboard_query(time_frame, session_id, offset, limit)
+    with pooled_connection() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(query, params)
+        leaderboard = cursor.fetchall()
+        cursor.close()
     return leaderboard
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["backfill"]:
+        initialize_database()
+        print(f"Rebuilt {backfill_daily_totals()} daily total rows from answer_log")
+    elif sys.argv[1:] == ["migrate"]:
+        applied = initialize_database()
+        print(f"Applied migrations {applied}" if applied else "Schema is up to date")
+    else:
+        print("Usage: python database.py backfill|migrate")
+        sys.exit(1)
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import random
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from metrics import POLLS_SENT, SEND_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows about 20 messages per minute in a group, one per second in a private chat
+# and roughly 30 per second across all chats
+GROUP_MESSAGES_PER_MINUTE = float(os.getenv("GROUP_MESSAGES_PER_MINUTE", "20"))
+PRIVATE_MESSAGES_PER_SECOND = float(os.getenv("PRIVATE_MESSAGES_PER_SECOND", "1"))
+GLOBAL_MESSAGES_PER_SECOND = float(os.getenv("GLOBAL_MESSAGES_PER_SECOND", "30"))
+
+SEND_MAX_ATTEMPTS = int(os.getenv("SEND_MAX_ATTEMPTS", "5"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+# Report progress to the admin after this many polls
+PROGRESS_EVERY = int(os.getenv("PROGRESS_EVERY", "10"))
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def drain(self, seconds):
+        """Empties the bucket and holds it empty for `seconds` (used after a RetryAfter)."""
+        self._tokens = -seconds * self.rate
+        self._updated = asyncio.get_running_loop().time()
+
+
+class PollDispatcher:
+    """Sends polls as fast as Telegram's per-chat and global limits allow."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._global = TokenBucket(GLOBAL_MESSAGES_PER_SECOND, capacity=GLOBAL_MESSAGES_PER_SECOND)
+        self._chats = {}
+
+    def _bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if _is_group(chat_id):
+                bucket = TokenBucket(GROUP_MESSAGES_PER_MINUTE / 60)
+            else:
+                bucket = TokenBucket(PRIVATE_MESSAGES_PER_SECOND)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def send_poll(self, chat_id, poll):
+        """
+        Sends one quiz poll, waiting for rate-limit tokens first.
+        Honors RetryAfter and retries transient network errors with bounded exponential backoff.
+        Raises the last error if the poll could not be sent.
+        """
+        bucket = self._bucket(chat_id)
+        for attempt in range(1, SEND_MAX_ATTEMPTS + 1):
+            await bucket.acquire()
+            await self._global.acquire()
+            try:
+                message = await self.bot.send_poll(
+                    chat_id=chat_id,
+                    question=poll['question'],
+                    options=poll['options'],
+                    type="quiz",
+                    correct_option_id=poll['correct_option_id'],
+                    is_anonymous=False,
+                    explanation=poll['explanation'] or None  # This adds the bulb icon with explanation
+                )
+                POLLS_SENT.inc()
+                return message
+            except RetryAfter as e:
+                if attempt == SEND_MAX_ATTEMPTS:
+                    raise
+                SEND_RETRIES.inc(cause="flood")
+                logger.warning(f"⚠️ Flood control in chat {chat_id}, retrying in {e.retry_after}s")
+                bucket.drain(e.retry_after)
+            except (BadRequest, Forbidden):
+                raise
+            except (TimedOut, NetworkError) as e:
+                if attempt == SEND_MAX_ATTEMPTS:
+                    raise
+                SEND_RETRIES.inc(cause="network")
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * (0.5 + random.random() / 2)
+                logger.warning(f"⚠️ Network error sending to {chat_id} ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def run(self, chat_id, polls, on_sent, on_progress=None, checkpoint=None):
+        """
+        Sends `polls` (an iterable or async iterable) in order to one chat.
+        `on_sent(poll, message)` is awaited after each successful send and `on_progress(sent, failed, total)`
+        every PROGRESS_EVERY polls and once at the end; `total` is None while it is not yet known.
+        `checkpoint()` is awaited before each poll and may block (pause) or return False (stop).
+        Returns (sent, failed).
+        """
+        sent = failed = 0
+        total = len(polls) if hasattr(polls, '__len__') else None
+        if not hasattr(polls, '__aiter__'):
+            polls = _aiter(polls)
+        async for poll in polls:
+            if checkpoint and not await checkpoint():
+                break
+            try:
+                message = await self.send_poll(chat_id, poll)
+                await on_sent(poll, message)
+                sent += 1
+            except Exception as e:
+                logger.error(f"❌ Failed to send question #{poll['label']}: {e}")
+                failed += 1
+            if on_progress and (sent + failed) % PROGRESS_EVERY == 0 and sent + failed != total:
+                await on_progress(sent, failed, total)
+        if on_progress:
+            await on_progress(sent, failed, sent + failed)
+        return sent, failed
+
+
+def _is_group(chat_id):
+    """Group and channel ids are negative; @username targets are channels."""
+    try:
+        return int(chat_id) < 0
+    except ValueError:
+        return True
+
+
+async def _aiter(iterable):
+    for item in iterable:
+        yield item
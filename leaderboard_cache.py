@@ -0,0 +1,46 @@
+import os
+
+from cache import TTLCache
+
+LEADERBOARD_CACHE_TTL = int(os.getenv("LEADERBOARD_CACHE_TTL", "30"))
+LEADERBOARD_CACHE_SIZE = 256
+
+TIME_FRAMES = ('daily', 'weekly', 'monthly', 'all')
+
+
+class LeaderboardCache:
+    """Rendered leaderboard pages keyed by (time_frame, session_id), then by page number."""
+
+    def __init__(self, ttl=LEADERBOARD_CACHE_TTL, maxsize=LEADERBOARD_CACHE_SIZE):
+        self._cache = TTLCache(maxsize, ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, time_frame, session_id=None, page=1):
+        pages = self._cache.get((time_frame, session_id), count=False)
+        message = pages.get(page) if pages else None
+        if message is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return message
+
+    def set(self, time_frame, session_id, message, page=1):
+        key = (time_frame, session_id)
+        pages = self._cache.get(key, count=False)
+        if pages is None:
+            # Later pages share the first page's expiry so a board never mixes generations for long
+            pages = {}
+            self._cache.set(key, pages)
+        pages[page] = message
+
+    def invalidate_answers(self, rows):
+        """Drops entries affected by a batch of logged answers."""
+        for session_id in {row[3] for row in rows}:
+            self._cache.pop(('session', session_id))
+        # New answers are always recent, so every time-frame board changes
+        for time_frame in TIME_FRAMES:
+            self._cache.pop((time_frame, None))
+
+    def stats(self):
+        return {'size': len(self._cache), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import os
+import time
+
+import database as db
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Hot polls stay in memory; anything else is loaded from quiz_polls on demand
+POLL_CACHE_SIZE = int(os.getenv("POLL_CACHE_SIZE", "20000"))
+POLL_CACHE_TTL = int(os.getenv("POLL_CACHE_TTL", str(6 * 3600)))
+POLL_RETENTION_DAYS = int(os.getenv("POLL_RETENTION_DAYS", "30"))
+POLL_EXPIRY_INTERVAL = int(os.getenv("POLL_EXPIRY_INTERVAL", "3600"))
+
+# Unknown poll ids (e.g. polls not sent by this bot) are remembered briefly to avoid repeat lookups
+_NOT_FOUND = (None, None, None)
+_NOT_FOUND_TTL = 60
+# Attempts at persisting a sent poll before answers to it are only scored from the cache
+SAVE_ATTEMPTS = 3
+
+
+class PollRegistry:
+    """Maps poll ids to (correct_option_id, session_id, sent_at), persisted in Postgres with an LRU/TTL cache in front."""
+
+    def __init__(self, cache_size=POLL_CACHE_SIZE, cache_ttl=POLL_CACHE_TTL):
+        self._cache = TTLCache(cache_size, cache_ttl)
+        self._task = None
+
+    def __len__(self):
+        return len(self._cache)
+
+    async def register(self, poll_id, correct_option_id, session_id, position=None, sent_at=None):
+        """
+        Keeps a newly sent poll hot in the cache and persists it (advancing the session's run cursor past `position`).
+        `sent_at` is the send time as a Unix timestamp, now by default.
+        The poll is cached before it is written, so answers arriving during the write are scored,
+        and a failed write doesn't lose the answers of a poll that was sent.
+        """
+        self._cache.set(poll_id, (correct_option_id, session_id, sent_at or time.time()))
+        for attempt in range(SAVE_ATTEMPTS):
+            try:
+                await db.run(db.save_poll, poll_id, correct_option_id, session_id, position)
+                return
+            except Exception as e:
+                if attempt == SAVE_ATTEMPTS - 1:
+                    logger.error(f"❌ Could not save poll {poll_id}, its answers are scored from memory only: {e}")
+                    return
+                logger.warning(f"⚠️ Could not save poll {poll_id} ({e}), retrying")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    def remember(self, poll_id, correct_option_id, session_id, sent_at=None):
+        """Caches a poll registered by another worker, replacing a cached miss for it."""
+        self._cache.set(poll_id, (correct_option_id, session_id, sent_at))
+
+    async def lookup(self, poll_id):
+        """Returns (correct_option_id, session_id, sent_at) for a poll, or None if the poll is unknown."""
+        entry = self._cache.get(poll_id)
+        if entry is None:
+            row = await db.run(db.get_poll, poll_id)
+            if row is None:
+                # register() or remember() may have cached the poll while the query ran
+                entry = self._cache.get(poll_id, count=False)
+                if entry is not None and entry is not _NOT_FOUND:
+                    return entry
+                self._cache.set(poll_id, _NOT_FOUND, ttl=_NOT_FOUND_TTL)
+                return None
+            entry = (row['correct_option_id'], row['session_id'], row['created_at'].timestamp())
+            self._cache.set(poll_id, entry)
+        if entry is _NOT_FOUND:
+            return None
+        return entry
+
+    def start(self):
+        """Starts the periodic expiry of old polls."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._expire_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _expire_loop(self):
+        while True:
+            try:
+                deleted = await db.run(db.expire_polls, POLL_RETENTION_DAYS)
+                if deleted:
+                    logger.info(f"Expired {deleted} polls older than {POLL_RETENTION_DAYS} days")
+            except Exception as e:
+                logger.error(f"❌ Failed to expire old polls: {e}")
+            await asyncio.sleep(POLL_EXPIRY_INTERVAL)
@@ -0,0 +1,191 @@
+import asyncio
+import bisect
+import logging
+import os
+
+import database as db
+from cache import TTLCache
+from quiz_sheet import OPTION_LABELS
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the answer-time histogram buckets; slower answers go in one last bucket
+ANSWER_SECONDS_BUCKETS = (2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+POLL_STATS_FLUSH_INTERVAL = float(os.getenv("POLL_STATS_FLUSH_INTERVAL", "5"))
+# Per-user scores are kept for this many recent sessions, for this long
+SESSION_SCORES_SIZE = 64
+SESSION_SCORES_TTL = 12 * 3600
+
+
+class PollAggregate:
+    """Answer counts for one poll: per option, per answer-time bucket, and in total."""
+    __slots__ = ('session_id', 'correct_option_id', 'option_counts', 'answer_seconds', 'answers', 'correct')
+
+    def __init__(self, session_id, correct_option_id):
+        self.session_id = session_id
+        self.correct_option_id = correct_option_id
+        self.option_counts = [0] * len(OPTION_LABELS)
+        self.answer_seconds = [0] * (len(ANSWER_SECONDS_BUCKETS) + 1)
+        self.answers = 0
+        self.correct = 0
+
+    def add(self, other):
+        if len(other.option_counts) > len(self.option_counts):
+            self.option_counts.extend([0] * (len(other.option_counts) - len(self.option_counts)))
+        for i, count in enumerate(other.option_counts):
+            self.option_counts[i] += count
+        for i, count in enumerate(other.answer_seconds):
+            self.answer_seconds[i] += count
+        self.answers += other.answers
+        self.correct += other.correct
+
+
+class PollStatsAggregator:
+    """
+    Live per-poll results and per-session scores, updated in O(1) per answer.
+    Poll aggregates are kept as deltas and added into poll_stats every POLL_STATS_FLUSH_INTERVAL
+    seconds, so several workers can aggregate the same poll.
+    """
+
+    def __init__(self, flush_interval=POLL_STATS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending = {}
+        # session_id -> {user_id: [username, correct, wrong]}
+        self._scores = TTLCache(SESSION_SCORES_SIZE, SESSION_SCORES_TTL)
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def pending(self):
+        return len(self._pending)
+
+    def record(self, poll_id, session_id, correct_option_id, option_id, seconds, user_id, username):
+        """Counts one answer; `seconds` since the poll was sent may be None if that is unknown."""
+        aggregate = self._pending.get(poll_id)
+        if aggregate is None:
+            aggregate = self._pending[poll_id] = PollAggregate(session_id, correct_option_id)
+        if option_id >= len(aggregate.option_counts):
+            aggregate.option_counts.extend([0] * (option_id + 1 - len(aggregate.option_counts)))
+        aggregate.option_counts[option_id] += 1
+        if seconds is not None:
+            aggregate.answer_seconds[bisect.bisect_left(ANSWER_SECONDS_BUCKETS, max(seconds, 0))] += 1
+        aggregate.answers += 1
+        is_correct = option_id == correct_option_id
+        aggregate.correct += is_correct
+        self.record_score(session_id, user_id, username, is_correct)
+
+    def record_score(self, session_id, user_id, username, is_correct):
+        """Counts one answer towards the session's scores (also used for answers taken by other workers)."""
+        scores = self._scores.get(session_id, count=False)
+        if scores is None:
+            scores = {}
+            self._scores.set(session_id, scores)
+        entry = scores.get(user_id)
+        if entry is None:
+            entry = scores[user_id] = [username, 0, 0]
+        if username:
+            entry[0] = username
+        entry[1 if is_correct else 2] += 1
+
+    def scores(self, session_id):
+        """Returns {user_id: [username, correct, wrong]} for a session, or None if none were recorded here."""
+        return self._scores.get(session_id, count=False)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stops the periodic flush and writes whatever is pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """Adds the pending deltas into poll_stats; on failure they are kept for the next flush."""
+        async with self._lock:
+            batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            try:
+                await db.run(db.save_poll_stats, [
+                    (poll_id, a.session_id, a.correct_option_id, a.option_counts, a.answer_seconds, a.answers, a.correct)
+                    for poll_id, a in batch.items()
+                ])
+            except Exception as e:
+                logger.error(f"❌ Failed to flush stats for {len(batch)} polls: {e}")
+                for poll_id, aggregate in batch.items():
+                    current = self._pending.get(poll_id)
+                    if current is None:
+                        self._pending[poll_id] = aggregate
+                    else:
+                        current.add(aggregate)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+def median_seconds(answer_seconds):
+    """Upper bound of the histogram bucket holding the median answer time, or None without timings."""
+    total = sum(answer_seconds)
+    if not total:
+        return None
+    cumulative = 0
+    for bound, count in zip(ANSWER_SECONDS_BUCKETS + (None,), answer_seconds):
+        cumulative += count
+        if cumulative * 2 >= total:
+            return bound if bound is not None else float('inf')
+
+
+def rank_scores(scores, limit):
+    """Orders {user_id: [username, correct, wrong]} like the leaderboard; tied scores share a rank."""
+    ordered = sorted(scores.items(), key=lambda item: (-item[1][1], item[1][2], item[0]))
+    ranked = []
+    for position, (user_id, (username, correct, wrong)) in enumerate(ordered[:limit], start=1):
+        if ranked and (ranked[-1]['correct'], ranked[-1]['wrong']) == (correct, wrong):
+            rank = ranked[-1]['rank']
+        else:
+            rank = position
+        ranked.append({'user_id': user_id, 'username': username, 'correct': correct, 'wrong': wrong, 'rank': rank})
+    return ranked
+
+
+def format_summary(session_id, polls, leaderboard, hardest=5):
+    """
+    Renders the end-of-quiz summary as plain text from poll_stats rows (see db.get_session_poll_stats)
+    and ranked leaderboard rows.
+    """
+    answered = [p for p in polls if p['answers']]
+    total_answers = sum(p['answers'] for p in answered)
+    lines = [f"📊 Quiz summary (Session ID: {session_id})", f"✍️ {total_answers} answers to {len(answered)} questions"]
+    if total_answers:
+        lines.append(f"🎯 {100 * sum(p['correct'] for p in answered) / total_answers:.0f}% correct overall")
+
+    if answered:
+        lines += ["", "🧠 Hardest questions:"]
+        answered.sort(key=lambda p: (p['correct'] / p['answers'], -p['answers']))
+        for p in answered[:hardest]:
+            label = p['label'] or (p['position'] + 1 if p['position'] is not None else "?")
+            counts = p['option_counts']
+            top = max(range(len(counts)), key=counts.__getitem__)
+            line = (
+                f"#{label}: {100 * p['correct'] / p['answers']:.0f}% correct of {p['answers']}, "
+                f"most picked {OPTION_LABELS[top] if top < len(OPTION_LABELS) else top + 1} "
+                f"({100 * counts[top] / p['answers']:.0f}%)"
+            )
+            median = median_seconds(p['answer_seconds'])
+            if median is not None:
+                line += f", median {'over ' + str(ANSWER_SECONDS_BUCKETS[-1]) if median == float('inf') else '≤ ' + str(median)}s"
+            lines.append(line)
+
+    if leaderboard:
+        lines += ["", "🏆 Session leaderboard:"]
+        lines += [f"{row['rank']}. {row['username'] or 'Unknown'} - {row['correct']} correct, {row['wrong']} wrong"
+                  for row in leaderboard]
+    return "\n".join(lines)
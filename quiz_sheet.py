@@ -0,0 +1,59 @@
+from collections import namedtuple
+
+OPTION_LABELS = ('A', 'B', 'C', 'D')
+
+# Field name -> column header in the quiz sheet
+COLUMNS = {
+    'question_no': "No.",
+    'question_english': "Question (English)",
+    'question_hindi': "प्रश्न (Hindi)",
+    'explanation_english': "Explanation (English)",
+    'explanation_hindi': "व्याख्या (Hindi)",
+    'exam_name_year': "Exam Name & Year",
+    'answer_english': "Answer (English)",
+    'answer_hindi': "उत्तर (Hindi)",
+}
+for _label in OPTION_LABELS:
+    COLUMNS[f'option_{_label.lower()}_english'] = f"Option {_label}"
+    COLUMNS[f'option_{_label.lower()}_hindi'] = f"विकल्प {_label}"
+
+QuestionRow = namedtuple('QuestionRow', ['row_no'] + list(COLUMNS))
+
+
+def cell_text(value):
+    """Converts a cell value to stripped text; empty cells become ''."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def read_questions(source):
+    """
+    Lazily yields one QuestionRow per non-empty data row of the first sheet.
+    `source` is a path or a binary file-like object. Headers are mapped to column indices once;
+    columns missing from the sheet read as ''.
+    """
+    # Imported here so openpyxl stays out of the boot path until a sheet is uploaded
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        positions = {cell_text(name): i for i, name in enumerate(header)}
+        indices = [positions.get(name) for name in COLUMNS.values()]
+
+        for row_no, values in enumerate(rows, start=2):
+            if not any(value is not None for value in values):
+                continue
+            width = len(values)
+            yield QuestionRow(row_no, *(
+                cell_text(values[i]) if i is not None and i < width else ""
+                for i in indices
+            ))
+    finally:
+        workbook.close()
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import re
+import unicodedata
+from collections import namedtuple
+
+from quiz_sheet import OPTION_LABELS
+
+# Telegram limits, kept a little stricter than the API for safety
+MAX_QUESTION_LENGTH = 255
+MAX_OPTION_LENGTH = 80
+MAX_EXPLANATION_LENGTH = 180
+MAX_EXPLANATION_LINES = 3
+
+# Common Hindi patterns for each option, checked in option order
+HINDI_ANSWER_PATTERNS = [
+    re.compile('|'.join(map(re.escape, patterns)))
+    for patterns in (
+        ('अ', 'A', 'ए'),
+        ('ब', 'B', 'बी'),
+        ('स', 'C', 'सी'),
+        ('द', 'D', 'डी'),
+    )
+]
+
+Rejection = namedtuple('Rejection', 'row_no label reason')
+RowWarning = namedtuple('RowWarning', 'row_no label message')
+ValidationReport = namedtuple('ValidationReport', 'polls rejected warnings total')
+
+
+def answer_option_id(answer_english, answer_hindi):
+    """
+    Determines the correct option ID (0-3 for A-D) from English or Hindi answer text.
+    Returns None if neither can be parsed.
+    """
+    # Check English answer first
+    english = answer_english.strip().upper() if answer_english else ""
+    if len(english) == 1 and english in OPTION_LABELS:
+        return ord(english) - ord('A')
+
+    # Then the Hindi answer patterns
+    if answer_hindi:
+        for option_id, pattern in enumerate(HINDI_ANSWER_PATTERNS):
+            if pattern.search(answer_hindi):
+                return option_id
+    return None
+
+
+def _normalize_text(text):
+    return ' '.join(unicodedata.normalize('NFC', text).split()).casefold()
+
+
+def question_hash(poll):
+    """Content hash identifying a question regardless of case, spacing, label or explanation."""
+    content = [_normalize_text(poll['question']), [_normalize_text(o) for o in poll['options']], poll['correct_option_id']]
+    return hashlib.sha256(json.dumps(content, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def normalize_row(row):
+    """
+    Builds the bilingual poll for one QuestionRow.
+    Returns (poll, rejection_reason, warnings); poll is None when the row is rejected.
+    """
+    warnings = []
+
+    # Combine English and Hindi questions
+    question = row.question_english
+    if row.question_hindi:
+        question += f"\n\n{row.question_hindi}"
+
+    # Combine options (English and Hindi)
+    options = []
+    for label in OPTION_LABELS:
+        combined_option = getattr(row, f"option_{label.lower()}_english")
+        option_hin = getattr(row, f"option_{label.lower()}_hindi")
+        if option_hin:
+            combined_option += f" / {option_hin}"
+        options.append(combined_option)
+
+    # Explanation: Exam Name & Year at the top, then Hindi, then English
+    explanation = row.exam_name_year
+    if row.explanation_hindi:
+        explanation += row.explanation_hindi
+    if row.explanation_english:
+        explanation = f"{explanation}\n{row.explanation_english}" if explanation else row.explanation_english
+
+    if len(question) > MAX_QUESTION_LENGTH:
+        return None, f"question exceeds {MAX_QUESTION_LENGTH} characters", warnings
+
+    for label, option in zip(OPTION_LABELS, options):
+        if len(option) > MAX_OPTION_LENGTH:
+            return None, f"option {label} exceeds {MAX_OPTION_LENGTH} characters", warnings
+
+    # Long explanations are truncated rather than rejected
+    if len(explanation) > MAX_EXPLANATION_LENGTH:
+        explanation = explanation[:MAX_EXPLANATION_LENGTH] + "..."
+        warnings.append(f"explanation truncated to {MAX_EXPLANATION_LENGTH} characters")
+
+    if explanation.count('\n') >= MAX_EXPLANATION_LINES:
+        explanation = '\n'.join(explanation.split('\n')[:MAX_EXPLANATION_LINES])
+        warnings.append(f"explanation trimmed to {MAX_EXPLANATION_LINES} lines")
+
+    if not question or not all(opt.strip() for opt in options):
+        return None, "missing question or options", warnings
+
+    correct_option_id = answer_option_id(row.answer_english, row.answer_hindi)
+    if correct_option_id is None:
+        correct_option_id = 0
+        warnings.append(f"answer '{row.answer_english or row.answer_hindi}' not recognised, defaulted to A")
+
+    poll = {
+        'label': row.question_no,
+        'question': question,
+        'options': options,
+        'correct_option_id': correct_option_id,
+        'explanation': explanation,
+    }
+    poll['hash'] = question_hash(poll)
+    return poll, None, warnings
+
+
+def validate_sheet(rows):
+    """
+    Normalizes and validates every row before anything is sent.
+    Returns a ValidationReport with the ready-to-send polls in sheet order plus per-row rejections and warnings.
+    Repeats of an earlier row in the same sheet are rejected.
+    """
+    polls = []
+    rejected = []
+    warnings = []
+    total = 0
+    seen = {}
+    for row in rows:
+        total += 1
+        label = row.question_no or str(row.row_no)
+        try:
+            poll, reason, row_warnings = normalize_row(row)
+        except Exception as e:
+            poll, reason, row_warnings = None, f"could not be read ({e})", []
+        for message in row_warnings:
+            warnings.append(RowWarning(row.row_no, label, message))
+        if poll is not None and poll['hash'] in seen:
+            poll, reason = None, f"duplicate of row {seen[poll['hash']]}"
+        if poll is None:
+            rejected.append(Rejection(row.row_no, label, reason))
+        else:
+            seen[poll['hash']] = row.row_no
+            polls.append(poll)
+    return ValidationReport(polls, rejected, warnings, total)
+
+
+def format_report(report, limit=30, known=None):
+    """
+    Renders a validation report as plain text, listing at most `limit` problem rows.
+    `known` is the number of ready questions already in the question bank, if it was checked.
+    """
+    lines = [
+        f"📋 Rows: {report.total}",
+        f"✅ Ready to send: {len(report.polls)}",
+        f"❌ Rejected: {len(report.rejected)}",
+        f"⚠️ Warnings: {len(report.warnings)}",
+    ]
+    if known is not None:
+        lines.append(f"♻️ Already in question bank: {known}")
+    problems = [(r.row_no, f"❌ Row {r.row_no} (#{r.label}): {r.reason}") for r in report.rejected]
+    problems += [(w.row_no, f"⚠️ Row {w.row_no} (#{w.label}): {w.message}") for w in report.warnings]
+    problems.sort(key=lambda problem: problem[0])
+    if problems:
+        lines.append("")
+        lines.extend(text for _row_no, text in problems[:limit])
+        if len(problems) > limit:
+            lines.append(f"...and {len(problems) - limit} more")
+    return "\n".join(lines)
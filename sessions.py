@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Session lifecycle states
+SCHEDULED = 'scheduled'
+RUNNING = 'running'
+PAUSED = 'paused'
+FINISHED = 'finished'
+
+
+def parse_chat_id(value):
+    """Returns a numeric chat id as int, or the value unchanged (e.g. an @channel username)."""
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class QuizSession:
+    """One quiz being sent to one chat."""
+
+    def __init__(self, session_id, chat_id, state=RUNNING):
+        self.session_id = session_id
+        self.chat_id = chat_id
+        self.state = state
+        self.started_at = datetime.now(timezone.utc)
+        self.task = None
+        self.sent = 0
+        self.failed = 0
+        self.total = None
+        self._running = asyncio.Event()
+        if state != PAUSED:
+            self._running.set()
+
+    def start(self):
+        """Moves a scheduled session to running."""
+        if self.state == SCHEDULED:
+            self.state = RUNNING
+
+    async def checkpoint(self):
+        """Waits while the session is paused; returns False once it has been finished."""
+        await self._running.wait()
+        return self.state != FINISHED
+
+    def pause(self):
+        if self.state != RUNNING:
+            return False
+        self.state = PAUSED
+        self._running.clear()
+        return True
+
+    def resume(self):
+        if self.state != PAUSED:
+            return False
+        self.state = RUNNING
+        self._running.set()
+        return True
+
+    def finish(self):
+        self.state = FINISHED
+        self._running.set()
+
+    def apply(self, state):
+        """Moves the session to `state` as reported by another worker."""
+        if state == FINISHED:
+            self.finish()
+        elif state == PAUSED:
+            self.pause()
+        elif state == RUNNING:
+            self.start()
+            self.resume()
+
+    def describe(self):
+        progress = f"{self.sent}/{self.total}" if self.total is not None else f"{self.sent}"
+        return f"{self.chat_id}: {self.state}, {progress} sent (Session ID: {self.session_id})"
+
+
+class SessionManager:
+    """Tracks the latest quiz session per chat and the background task sending it."""
+
+    def __init__(self):
+        self._sessions = {}
+        self._latest = None
+
+    def get(self, chat_id):
+        return self._sessions.get(parse_chat_id(chat_id))
+
+    def active(self, chat_id):
+        session = self.get(chat_id)
+        return session if session and session.state != FINISHED else None
+
+    def latest(self):
+        return self._latest
+
+    def all(self):
+        return list(self._sessions.values())
+
+    def create(self, chat_id, session_id, state=RUNNING):
+        """Registers a new session for a chat; returns None if that chat already has an unfinished one."""
+        chat_id = parse_chat_id(chat_id)
+        if self.active(chat_id):
+            return None
+        session = QuizSession(session_id, chat_id, state)
+        self._sessions[chat_id] = session
+        self._latest = session
+        return session
+
+    def track(self, chat_id, session_id, state):
+        """
+        Returns the chat's session with this id, registering it in `state` (and replacing whatever
+        the chat had) if it is not known yet. Used for sessions another worker is sending.
+        """
+        session = self.get(chat_id)
+        if session is None or session.session_id != session_id:
+            session = QuizSession(session_id, parse_chat_id(chat_id), state)
+            self._sessions[session.chat_id] = session
+            self._latest = session
+        return session
+
+    def launch(self, session, coro, create_task):
+        """Runs `coro` as the session's task via `create_task`; the session is finished when it returns."""
+        session.task = create_task(self._run(session, coro))
+        return session.task
+
+    async def _run(self, session, coro):
+        try:
+            await coro
+        except asyncio.CancelledError:
+            logger.info(f"Session {session.session_id} cancelled")
+            raise
+        finally:
+            session.finish()
+
+    async def shutdown(self):
+        """Cancels every unfinished session task."""
+        tasks = [s.task for s in self._sessions.values() if s.task and not s.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
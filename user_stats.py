@@ -0,0 +1,134 @@
+from array import array
+
+
+class FenwickTree:
+    """Counts of non-negative integer keys with O(log n) updates and prefix sums; grows as keys grow."""
+
+    def __init__(self, size=64):
+        self._counts = array('l', [0]) * size
+        self._tree = array('l', [0]) * (size + 1)
+        self.total = 0
+
+    def _grow(self, key):
+        size = len(self._counts)
+        while size <= key:
+            size *= 2
+        self._counts.extend(array('l', [0]) * (size - len(self._counts)))
+        # Rebuild the tree from the raw counts in O(n)
+        tree = array('l', [0]) * (size + 1)
+        for i, count in enumerate(self._counts, start=1):
+            tree[i] += count
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def add(self, key, delta=1):
+        if key >= len(self._counts):
+            self._grow(key)
+        self._counts[key] += delta
+        self.total += delta
+        i = key + 1
+        size = len(self._counts)
+        while i <= size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def count_le(self, key):
+        """Number of entries with a key <= `key`."""
+        if key < 0:
+            return 0
+        i = min(key + 1, len(self._counts))
+        result = 0
+        while i > 0:
+            result += self._tree[i]
+            i -= i & -i
+        return result
+
+
+class UserStatsIndex:
+    """
+    Per-user answer counts and streaks in parallel arrays, with ranks answered by order-statistics trees.
+    Ranking matches the leaderboard: more correct first, then fewer wrong; equal scores share a rank.
+    """
+
+    def __init__(self):
+        self._slots = {}
+        self.usernames = []
+        self.correct = array('l')
+        self.wrong = array('l')
+        self.current_streak = array('l')
+        self.best_streak = array('l')
+        # Users per correct count, and per wrong count within each correct count for tie-breaks
+        self._by_correct = FenwickTree()
+        self._wrong_by_correct = {}
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _index(self, slot, sign):
+        correct = self.correct[slot]
+        self._by_correct.add(correct, sign)
+        bucket = self._wrong_by_correct.get(correct)
+        if bucket is None:
+            bucket = self._wrong_by_correct[correct] = FenwickTree(8)
+        bucket.add(self.wrong[slot], sign)
+        if bucket.total == 0:
+            del self._wrong_by_correct[correct]
+
+    def _slot(self, user_id, username):
+        slot = self._slots.get(user_id)
+        if slot is None:
+            slot = self._slots[user_id] = len(self.usernames)
+            self.usernames.append(username)
+            for column in (self.correct, self.wrong, self.current_streak, self.best_streak):
+                column.append(0)
+            self._index(slot, 1)
+        elif username:
+            self.usernames[slot] = username
+        return slot
+
+    def load(self, user_id, username, correct, wrong, current_streak, best_streak):
+        """Sets one user's totals, e.g. from the startup query."""
+        slot = self._slot(user_id, username)
+        self._index(slot, -1)
+        self.correct[slot] = correct
+        self.wrong[slot] = wrong
+        self.current_streak[slot] = current_streak
+        self.best_streak[slot] = best_streak
+        self._index(slot, 1)
+
+    def record(self, user_id, username, is_correct):
+        """Applies one answer in O(log n)."""
+        slot = self._slot(user_id, username)
+        self._index(slot, -1)
+        if is_correct:
+            self.correct[slot] += 1
+            self.current_streak[slot] += 1
+            if self.current_streak[slot] > self.best_streak[slot]:
+                self.best_streak[slot] = self.current_streak[slot]
+        else:
+            self.wrong[slot] += 1
+            self.current_streak[slot] = 0
+        self._index(slot, 1)
+
+    def rank(self, slot):
+        correct = self.correct[slot]
+        ahead = self._by_correct.total - self._by_correct.count_le(correct)
+        ahead += self._wrong_by_correct[correct].count_le(self.wrong[slot] - 1)
+        return ahead + 1
+
+    def get(self, user_id):
+        """Returns a dict of the user's stats including rank, or None if the user has never answered."""
+        slot = self._slots.get(user_id)
+        if slot is None:
+            return None
+        return {
+            'username': self.usernames[slot],
+            'correct': self.correct[slot],
+            'wrong': self.wrong[slot],
+            'current_streak': self.current_streak[slot],
+            'best_streak': self.best_streak[slot],
+            'rank': self.rank(slot),
+            'users': len(self._slots),
+        }
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes
+from telegram import Update
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramWebhookHandler(tornado.web.RequestHandler):
+    """Accepts updates pushed by Telegram and hands them to the application's update queue."""
+
+    def initialize(self, bot_app, secret_token=None):
+        # `application` is taken by tornado for its own Application
+        self.bot_app = bot_app
+        self.secret_token = secret_token
+
+    async def post(self):
+        if self.secret_token and self.request.headers.get("X-Telegram-Bot-Api-Secret-Token") != self.secret_token:
+            raise tornado.web.HTTPError(403)
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.bot_app.bot)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"⚠️ Ignoring malformed webhook payload: {e}")
+            raise tornado.web.HTTPError(400)
+        await self.bot_app.update_queue.put(update)
+        self.set_status(200)
+
+    def log_exception(self, typ, value, tb):
+        # Don't log tracebacks for the 4xx responses raised above
+        if not isinstance(value, tornado.web.HTTPError):
+            super().log_exception(typ, value, tb)
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """Serves every registered metric in the Prometheus text format."""
+
+    def get(self):
+        self.set_header("Content-Type", metrics.CONTENT_TYPE)
+        self.write(metrics.render())
+
+
+def make_app(application, url_path, secret_token=None, metrics=True):
+    routes = [(rf"/{url_path}", TelegramWebhookHandler, dict(bot_app=application, secret_token=secret_token))]
+    if metrics:
+        routes.append((r"/metrics", MetricsHandler))
+    return tornado.web.Application(routes)
+
+
+def fork_workers(listen, port, workers):
+    """
+    Binds the listening socket once and forks `workers` processes that all accept on it.
+    Returns (sockets, worker index) in each worker. The parent stays in fork_processes restarting
+    crashed workers, and passes SIGINT/SIGTERM on to them; the workers shut down cleanly with
+    status 0, which fork_processes doesn't restart, and it exits once all of them have.
+    Must run before any event loop, thread or database connection is created.
+    """
+    sockets = bind_sockets(port, address=listen)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, _forward_signal)
+    worker = fork_processes(workers)
+    # Workers install their own handlers once their event loop is running
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, signal.SIG_DFL)
+    return sockets, worker
+
+
+def _forward_signal(signum, frame):
+    # Exiting here would get the workers killed (e.g. by the container) before they drain their answers
+    signal.signal(signum, signal.SIG_IGN)
+    os.killpg(os.getpgrp(), signum)
+
+
+async def serve(application, listen, port, url_path, webhook_url, secret_token=None, sockets=None, set_webhook=True,
+                metrics_port=None):
+    """
+    Runs the application behind our own tornado server so extra routes such as /metrics share the
+    webhook port. Mirrors Application.run_webhook: post_init, start, then stop, post_stop, shutdown,
+    post_shutdown when SIGINT or SIGTERM arrives.
+    With `sockets` from fork_workers the server accepts on those instead of binding `port`, and
+    only the worker given `set_webhook` registers the webhook with Telegram. Scrapes of a shared
+    socket would reach an arbitrary worker, so workers serve /metrics only on their own
+    `metrics_port`, if given.
+    """
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    if set_webhook:
+        await application.bot.set_webhook(
+            url=webhook_url, allowed_updates=Update.ALL_TYPES, secret_token=secret_token
+        )
+    await application.start()
+
+    server = HTTPServer(make_app(application, url_path, secret_token, metrics=not sockets), xheaders=True)
+    metrics_server = None
+    if sockets:
+        server.add_sockets(sockets)
+        logger.info(f"Serving webhook on {listen}:{port}")
+        if metrics_port:
+            metrics_server = HTTPServer(tornado.web.Application([(r"/metrics", MetricsHandler)]))
+            metrics_server.listen(metrics_port, address=listen)
+            logger.info(f"Serving this worker's /metrics on {listen}:{metrics_port}")
+    else:
+        server.listen(port, address=listen)
+        logger.info(f"Serving webhook and /metrics on {listen}:{port}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        server.stop()
+        if metrics_server:
+            metrics_server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)